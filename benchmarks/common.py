@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+"""
+Общие утилиты бенчмарков Open-with-chooser
+"""
+
+import importlib.util
+import statistics
+import time
+from pathlib import Path
+
+CHOOSER_PATH = Path(__file__).resolve().parent.parent / 'src' / 'open-with-chooser.py'
+
+
+def load_chooser(module_name: str = 'open_with_chooser'):
+    """Импорт src/open-with-chooser.py (имя файла содержит дефис)"""
+    spec = importlib.util.spec_from_file_location(module_name, CHOOSER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def measure(func, repeat: int = 5) -> dict:
+    """Медиана и минимум времени выполнения func в миллисекундах"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        'median_ms': round(statistics.median(timings), 3),
+        'min_ms': round(min(timings), 3)
+    }
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Проверка и замер определения контекста вызова (ContextDetector)
+
+Строит настоящие цепочки процессов IDE/файловый менеджер -> bash (как при
+запуске из встроенного терминала) и проверяет, что контекст определяется по
+IDE, а не по оболочке-родителю; оболочка без таких предков даёт terminal.
+Замеряет обход /proc без кэша и с кэшем. Скрипт завершается с кодом 1,
+если контекст не совпал с ожидаемым.
+
+Использование: python3 benchmarks/context_detector.py [--repeat 5]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from common import load_chooser, measure
+
+# (имя процесса-предка, ожидаемый контекст для оболочки под ним)
+TREES = [
+    ('code', 'vscode'),
+    ('cursor', 'cursor'),
+    ('nautilus', 'filemanager'),
+]
+
+
+def start_shell(bin_dir: Path, ancestor: str) -> tuple:
+    """Цепочка ancestor -> bash; возвращает процесс и PID bash (родителя селектора)"""
+    launcher = bin_dir / ancestor
+    if not launcher.exists():
+        # comm процесса — имя запущенного файла, поэтому достаточно ссылки на sh
+        launcher.symlink_to(shutil.which('sh'))
+    process = subprocess.Popen(
+        [str(launcher), '-c', 'bash -c \'echo $$; sleep 30; true\'; true'],
+        stdout=subprocess.PIPE, text=True, start_new_session=True
+    )
+    return process, int(process.stdout.readline())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Проверка и бенчмарк определения контекста')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    chooser = load_chooser()
+    # Контекст самого скрипта (например, запуск из терминала IDE) без правил оболочки
+    own_context = chooser.ContextDetector([]).get_invoker_context({}, os.getpid())
+
+    failures = []
+    results = {}
+    processes = []
+    shells = []
+    with tempfile.TemporaryDirectory(prefix='owc-context-') as tmp:
+        try:
+            cases = [(ancestor, expected) for ancestor, expected in TREES]
+            # Оболочка прямо под скриптом: terminal, если выше нет IDE или файлового менеджера
+            cases.append(('', own_context if own_context != 'unknown' else 'terminal'))
+            for ancestor, expected in cases:
+                if ancestor:
+                    process, shell_pid = start_shell(Path(tmp), ancestor)
+                else:
+                    process = subprocess.Popen(['bash', '-c', 'echo $$; sleep 30; true'],
+                                               stdout=subprocess.PIPE, text=True, start_new_session=True)
+                    shell_pid = int(process.stdout.readline())
+                processes.append(process)
+                shells.append(shell_pid)
+
+                detector = chooser.ContextDetector()
+                context = detector.get_invoker_context({}, shell_pid)
+                name = f'{ancestor or "script"} -> bash'
+                results[name] = context
+                if context != expected:
+                    failures.append({'tree': name, 'expected': expected, 'got': context})
+
+            shell_pid = shells[0]
+            results['detect_cold'] = measure(
+                lambda: chooser.ContextDetector().get_invoker_context({}, shell_pid), args.repeat)
+            detector = chooser.ContextDetector()
+            results['detect_cached'] = measure(
+                lambda: detector.get_invoker_context({}, shell_pid), args.repeat)
+
+            # Кэш демона не растёт сверх CONTEXT_CACHE_SIZE при потоке разных PID
+            for pid in range(1, chooser.CONTEXT_CACHE_SIZE * 2):
+                detector.get_invoker_context({}, pid)
+            results['cache_entries'] = len(detector._cache)
+            if len(detector._cache) > chooser.CONTEXT_CACHE_SIZE:
+                failures.append({'cache_entries': len(detector._cache),
+                                 'limit': chooser.CONTEXT_CACHE_SIZE})
+        finally:
+            for process in processes:
+                os.killpg(process.pid, signal.SIGKILL)
+                process.wait()
+
+    results['failures'] = failures
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
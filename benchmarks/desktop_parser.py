@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Сравнение DesktopEntryParser с xdg.DesktopEntry (pyxdg)
+
+Генерирует набор реалистичных .desktop файлов (локализованные ключи,
+группы [Desktop Action ...]) и замеряет разбор всего набора.
+
+Использование: python3 benchmarks/desktop_parser.py [--count 3000] [--repeat 5]
+"""
+
+import argparse
+import json
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from common import load_chooser, measure
+
+LOCALES = ['ar', 'be', 'bg', 'cs', 'da', 'de', 'el', 'es', 'fi', 'fr', 'he', 'hu',
+           'it', 'ja', 'ko', 'nl', 'pl', 'pt_BR', 'ru', 'sv', 'tr', 'uk', 'zh_CN', 'zh_TW']
+
+
+def write_entry(path: Path, index: int):
+    """Запись одного .desktop файла"""
+    lines = ['[Desktop Entry]', 'Type=Application', f'Name=Application {index}']
+    lines += [f'Name[{locale}]=Application {index} ({locale})' for locale in LOCALES]
+    lines.append(f'GenericName=Generic tool {index}')
+    lines += [f'Comment[{locale}]=Opens things of kind {index}' for locale in LOCALES]
+    lines += [
+        f'Exec=app{index} --new-window %U',
+        f'TryExec=app{index}',
+        f'Icon=app{index}',
+        'Terminal=false',
+        'Categories=Utility;Development;',
+        'Keywords=tool;editor;viewer;',
+        'MimeType=text/plain;text/html;image/png;application/pdf;',
+        'StartupNotify=true',
+        'Actions=new-window;new-private-window;',
+    ]
+    for action in ('new-window', 'new-private-window'):
+        lines += ['', f'[Desktop Action {action}]', f'Name={action}', f'Exec=app{index} --{action}']
+        lines += [f'Name[{locale}]={action} ({locale})' for locale in LOCALES]
+    path.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк разбора .desktop файлов')
+    parser.add_argument('--count', type=int, default=3000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    chooser = load_chooser()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        files = []
+        for index in range(args.count):
+            path = Path(tmp) / f'app{index}.desktop'
+            write_entry(path, index)
+            files.append(path)
+
+        native = chooser.DesktopEntryParser(['ru_RU', 'ru'])
+        results = {
+            'count': args.count,
+            'native': measure(lambda: [native.parse(path) for path in files], args.repeat)
+        }
+
+        try:
+            from xdg.DesktopEntry import DesktopEntry
+        except ImportError:
+            results['pyxdg'] = None
+        else:
+            results['pyxdg'] = measure(lambda: [DesktopEntry(str(path)) for path in files], args.repeat)
+            results['speedup'] = round(results['pyxdg']['median_ms'] / results['native']['median_ms'], 1)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Проверка и замер компилятора строк Exec (ExecTemplate)
+
+Прогоняет корпус строк Exec из реальных .desktop файлов (с ожидаемым argv)
+и проверяет разбиение целей на запуски (DesktopApp.build_commands),
+затем компилирует Exec всех установленных приложений и сообщает строки,
+которые не удалось разобрать. Замеряет компиляцию и подстановку целей.
+Скрипт завершается с кодом 1, если результат корпуса не совпал с ожидаемым.
+
+Использование: python3 benchmarks/exec_compiler.py [--repeat 5] [--targets 100]
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from common import load_chooser, measure
+
+NAME = 'App'
+ICON = 'app-icon'
+DESKTOP_FILE = '/usr/share/applications/app.desktop'
+
+# (Exec как в файле, цели, ожидаемый argv)
+CORPUS = [
+    ('firefox %u', ['https://example.org'], ['firefox', 'https://example.org']),
+    ('/usr/lib/firefox/firefox %u', [], ['/usr/lib/firefox/firefox']),
+    ('vlc --started-from-file %U', ['a.mp4', 'b.mp4'], ['vlc', '--started-from-file', 'a.mp4', 'b.mp4']),
+    ('gimp-2.10 %U', ['file:///tmp/a.png'], ['gimp-2.10', 'file:///tmp/a.png']),
+    ('evince %U', ['/tmp/a b.pdf'], ['evince', '/tmp/a b.pdf']),
+    ('eog %U', [], ['eog']),
+    ('gedit %U', ['a.txt'], ['gedit', 'a.txt']),
+    ('libreoffice --writer %U', ['a.odt'], ['libreoffice', '--writer', 'a.odt']),
+    ('/usr/share/code/code --unity-launch %F', ['a.py', 'b.py'], ['/usr/share/code/code', '--unity-launch', 'a.py', 'b.py']),
+    ('/usr/share/code/code --open-url %U', ['vscode://x'], ['/usr/share/code/code', '--open-url', 'vscode://x']),
+    ('mpv --player-operation-mode=pseudo-gui -- %U', ['a.mkv'], ['mpv', '--player-operation-mode=pseudo-gui', '--', 'a.mkv']),
+    ('okular %U', ['file:///tmp/a%20b.pdf'], ['okular', 'file:///tmp/a%20b.pdf']),
+    ('file-roller %U', ['a.zip'], ['file-roller', 'a.zip']),
+    ('inkscape %F', ['file:///tmp/a%20b.svg'], ['inkscape', '/tmp/a b.svg']),
+    ('kate -b %U', ['a.txt'], ['kate', '-b', 'a.txt']),
+    ('blender %f', ['a.blend'], ['blender', 'a.blend']),
+    ('rhythmbox %U', [], ['rhythmbox']),
+    ('xdg-open %u', ['a'], ['xdg-open', 'a']),
+    ('totem %U', ['a.ogg'], ['totem', 'a.ogg']),
+    ('gnome-terminal', [], ['gnome-terminal']),
+    ('xterm -name Terminal', [], ['xterm', '-name', 'Terminal']),
+    ('vim %F', ['a', 'b'], ['vim', 'a', 'b']),
+    ('nautilus --new-window %U', ['/tmp'], ['nautilus', '--new-window', '/tmp']),
+    ('thunderbird %u', ['mailto:a@b'], ['thunderbird', 'mailto:a@b']),
+    ('env BAMF_DESKTOP_FILE_HINT=/var/lib/snapd/desktop/applications/firefox_firefox.desktop /snap/bin/firefox %u',
+     ['https://a'], ['env', 'BAMF_DESKTOP_FILE_HINT=/var/lib/snapd/desktop/applications/firefox_firefox.desktop',
+                     '/snap/bin/firefox', 'https://a']),
+    ('/usr/bin/flatpak run --branch=stable --arch=x86_64 --command=telegram-desktop --file-forwarding '
+     'org.telegram.desktop -- @@u %u @@', ['tg://x'],
+     ['/usr/bin/flatpak', 'run', '--branch=stable', '--arch=x86_64', '--command=telegram-desktop',
+      '--file-forwarding', 'org.telegram.desktop', '--', '@@u', 'tg://x', '@@']),
+    ('/usr/bin/flatpak run --branch=stable --arch=x86_64 --command=gimp-2.10 --file-forwarding org.gimp.GIMP @@u %U @@',
+     ['a', 'b'], ['/usr/bin/flatpak', 'run', '--branch=stable', '--arch=x86_64', '--command=gimp-2.10',
+                  '--file-forwarding', 'org.gimp.GIMP', '@@u', 'a', 'b', '@@']),
+    ('/usr/bin/google-chrome-stable %U', ['https://a'], ['/usr/bin/google-chrome-stable', 'https://a']),
+    ('steam %U', [], ['steam']),
+    ('transmission-gtk %U', ['magnet:?xt=1'], ['transmission-gtk', 'magnet:?xt=1']),
+    # %i, %c, %k
+    ('gnome-calculator %i', [], ['gnome-calculator', '--icon', ICON]),
+    ('kwrite --caption %c %U', ['a'], ['kwrite', '--caption', NAME, 'a']),
+    ('app --desktop-file=%k', [], ['app', f'--desktop-file={DESKTOP_FILE}']),
+    ('app -qwindowtitle %c -qwindowicon %i', [], ['app', '-qwindowtitle', NAME, '-qwindowicon', '--icon', ICON]),
+    # %% и устаревшие коды
+    ('date +%%Y-%%m', [], ['date', '+%Y-%m']),
+    ('app %d %D %n %N %v %m %f', ['a'], ['app', 'a']),
+    # Кавычки и экранирование (Exec записан так, как в файле)
+    ('"/opt/Sublime Text/sublime_text" %F', ['a'], ['/opt/Sublime Text/sublime_text', 'a']),
+    ('sh -c "cd \\\\"$HOME\\\\" && exec app"', [], ['sh', '-c', 'cd "$HOME" && exec app']),
+    ('sh -c "echo \\\\$PATH \\\\\\\\n"', [], ['sh', '-c', 'echo $PATH \\n']),
+    ('sh -c "exec app \\\\"$1\\\\"" sh %f', ['a b'], ['sh', '-c', 'exec app "$1"', 'sh', 'a b']),
+    ('bash -c "app --file=%f"', ['x'], ['bash', '-c', 'app --file=x']),
+    ('"" %u', ['a'], ['', 'a']),
+    ('"app\\sname" %f', ['a'], ['app name', 'a']),
+    ("'/home/user/tor-browser/start-tor-browser.desktop' --detach %u", ['https://a'],
+     ['/home/user/tor-browser/start-tor-browser.desktop', '--detach', 'https://a']),
+    # Код поля внутри аргумента раскрывается в одно значение
+    ('app --open=%U', ['a', 'b'], ['app', '--open=a']),
+    ('app --file=%f', [], ['app', '--file=']),
+]
+
+# Строки, которые должны отклоняться
+INVALID = ['app "unterminated %f', 'sh -c "echo \\\\"']
+
+# (Exec, цели, ожидаемые команды DesktopApp.build_commands): каждая цель должна попасть в запуск
+BUILD_CASES = [
+    ('app %F', ['a', 'b'], [['app', 'a', 'b']]),
+    ('app %u', ['a', 'b'], [['app', 'a'], ['app', 'b']]),
+    # %U внутри аргумента раскрывается в одну цель: запуск на каждый файл
+    ('app --open=%U', ['a', 'b'], [['app', '--open=a'], ['app', '--open=b']]),
+    ('app -x%F', ['a', 'b'], [['app', '-xa'], ['app', '-xb']]),
+    ('app', ['a', 'b'], [['app', 'a', 'b']]),
+]
+
+
+def run_corpus(chooser) -> list:
+    """Сверка корпуса; список расхождений"""
+    failures = []
+    for exec_line, targets, expected in CORPUS:
+        try:
+            template = chooser.ExecTemplate.compile(exec_line)
+            argv = chooser.ExecTemplate.expand(template, targets, NAME, ICON, DESKTOP_FILE)
+        except ValueError as e:
+            argv = f'ValueError: {e}'
+        if argv != expected:
+            failures.append({'exec': exec_line, 'expected': expected, 'got': argv})
+
+    for exec_line in INVALID:
+        try:
+            chooser.ExecTemplate.compile(exec_line)
+        except ValueError:
+            continue
+        failures.append({'exec': exec_line, 'expected': 'ValueError', 'got': 'compiled'})
+
+    for exec_line, targets, expected in BUILD_CASES:
+        commands = chooser.DesktopApp('App', exec_line).build_commands(targets)
+        if commands != expected:
+            failures.append({'exec': exec_line, 'expected_commands': expected, 'got': commands})
+
+    # Экранирование ExecTemplate.quote обратимо компиляцией
+    for arg in ('/opt/My App/app', 'a"b$c`d\\e', '100%', "it's", 'plain'):
+        argv = chooser.ExecTemplate.expand(chooser.ExecTemplate.compile(chooser.ExecTemplate.quote(arg)), [])
+        if argv != [arg]:
+            failures.append({'quote': arg, 'expected': [arg], 'got': argv})
+    return failures
+
+
+def installed_exec_lines(chooser) -> list:
+    """Строки Exec установленных .desktop файлов"""
+    parser = chooser.DesktopEntryParser([])
+    lines = []
+    for directory in chooser.AppDiscovery()._desktop_dirs():
+        if not directory.is_dir():
+            continue
+        for path in directory.rglob('*.desktop'):
+            entry = parser.parse(path)
+            if entry and entry.get('Exec'):
+                lines.append(entry['Exec'])
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Проверка и бенчмарк компилятора Exec')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--targets', type=int, default=100, help='Число целей при подстановке')
+    args = parser.parse_args()
+
+    chooser = load_chooser()
+    ExecTemplate = chooser.ExecTemplate
+
+    failures = run_corpus(chooser)
+
+    installed = installed_exec_lines(chooser)
+    rejected = []
+    for exec_line in installed:
+        try:
+            ExecTemplate.compile(exec_line)
+        except ValueError:
+            rejected.append(exec_line)
+
+    lines = [exec_line for exec_line, _, _ in CORPUS] * 100
+    templates = [ExecTemplate.compile(exec_line) for exec_line in lines]
+    targets = [f'/tmp/file{index}.txt' for index in range(args.targets)]
+    results = {
+        'corpus': len(CORPUS),
+        'failures': failures,
+        'installed': len(installed),
+        'installed_rejected': rejected,
+        'compile': measure(lambda: [ExecTemplate.compile(exec_line) for exec_line in lines], args.repeat),
+        'expand': measure(lambda: [ExecTemplate.expand(template, targets, NAME, ICON, DESKTOP_FILE)
+                                   for template in templates], args.repeat),
+        'lines': len(lines)
+    }
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
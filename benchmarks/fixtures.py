@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+Синтетические данные для бенчмарков Open-with-chooser
+
+Дерево XDG с .desktop файлами, домашняя директория для поиска Tor Browser,
+файлы для определения MIME типов и исполняемые заглушки flatpak/snap/which
+с настраиваемой задержкой (переменная окружения BENCH_STUB_DELAY).
+"""
+
+import os
+from pathlib import Path
+
+LOCALES = ['de', 'es', 'fr', 'it', 'ja', 'pl', 'pt_BR', 'ru', 'uk', 'zh_CN']
+MIME_TYPES = [
+    'text/plain', 'text/html', 'text/x-python', 'text/markdown', 'application/pdf',
+    'image/png', 'image/jpeg', 'image/svg+xml', 'video/mp4', 'video/x-matroska',
+    'audio/mpeg', 'audio/flac', 'application/zip', 'application/json', 'inode/directory'
+]
+FLATPAK_APPS = 20
+SNAP_APPS = 20
+# Вызовы заглушек записываются в журнал, чтобы бенчмарк видел лишние процессы
+STUB_TEMPLATE = """#!/bin/sh
+echo "{name} $*" >> "$BENCH_STUB_LOG"
+[ -n "$BENCH_STUB_DELAY" ] && sleep "$BENCH_STUB_DELAY"
+{body}
+"""
+
+
+def write_stub(bin_dir: Path, name: str, body: str = 'exit 0'):
+    """Исполняемая заглушка команды"""
+    path = bin_dir / name
+    path.write_text(STUB_TEMPLATE.format(name=name, body=body))
+    path.chmod(0o755)
+
+
+def write_desktop_entry(path: Path, index: int):
+    """Реалистичный .desktop файл: локализованные ключи, MIME типы, действия"""
+    mime_types = ';'.join(MIME_TYPES[(index + offset) % len(MIME_TYPES)] for offset in range(3))
+    # Каждая десятая запись ссылается на отсутствующий исполняемый файл
+    command = 'bench-missing' if index % 10 == 9 else 'bench-app'
+    lines = ['[Desktop Entry]', 'Type=Application', f'Name=Bench App {index}']
+    lines += [f'Name[{locale}]=Bench App {index} ({locale})' for locale in LOCALES]
+    lines += [
+        f'GenericName=Generic tool {index % 50}',
+        f'Comment=Synthetic application {index}',
+        f'Exec={command} --profile "bench {index}" %F',
+        f'Icon=bench-app-{index % 20}',
+        'Terminal=false',
+        'Categories=Utility;',
+        f'Keywords=bench;tool{index % 50};',
+        f'MimeType={mime_types};',
+        'Actions=new-window;',
+        '',
+        '[Desktop Action new-window]',
+        'Name=New Window',
+        f'Exec={command} --new-window',
+    ]
+    path.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+
+
+def build_xdg_tree(root: Path, count: int) -> Path:
+    """XDG_DATA_DIRS с count .desktop файлами"""
+    applications = root / 'xdg' / 'applications'
+    applications.mkdir(parents=True, exist_ok=True)
+    for index in range(count):
+        write_desktop_entry(applications / f'bench-app-{index}.desktop', index)
+    return applications
+
+
+def build_home(root: Path, width: int = 8, depth: int = 4) -> Path:
+    """Домашняя директория с деревом проектов для поиска Tor Browser"""
+    home = root / 'home'
+    for branch in range(width):
+        directory = home / f'projects{branch}'
+        for level in range(depth):
+            directory = directory / f'level{level}'
+            for index in range(3):
+                (directory / f'file{index}.txt').parent.mkdir(parents=True, exist_ok=True)
+                (directory / f'file{index}.txt').write_text('data\n')
+        # Исключённые и скрытые директории не должны обходиться
+        (home / f'projects{branch}' / 'node_modules' / 'pkg').mkdir(parents=True, exist_ok=True)
+        (home / f'projects{branch}' / '.git' / 'objects').mkdir(parents=True, exist_ok=True)
+
+    tor = home / 'Downloads' / 'tor-browser' / 'Browser' / 'start-tor-browser'
+    tor.parent.mkdir(parents=True, exist_ok=True)
+    tor.write_text('#!/bin/sh\nexit 0\n')
+    tor.chmod(0o755)
+    (home / '.config').mkdir(exist_ok=True)
+    (home / '.cache').mkdir(exist_ok=True)
+    return home
+
+
+def build_targets(root: Path, count: int = 200) -> list:
+    """Файлы разных типов; часть без расширения требует анализа содержимого"""
+    directory = root / 'targets'
+    directory.mkdir(parents=True, exist_ok=True)
+    samples = [
+        ('.txt', b'plain text\n'),
+        ('.png', b'\x89PNG\r\n\x1a\n' + b'\0' * 32),
+        ('.pdf', b'%PDF-1.4\n'),
+        ('.html', b'<html></html>\n'),
+        ('.AppImage', b'\x7fELF' + b'\0' * 32),
+        ('', b'%PDF-1.4\n'),
+        ('', b'#!/bin/sh\necho\n'),
+    ]
+    targets = []
+    for index in range(count):
+        suffix, content = samples[index % len(samples)]
+        path = directory / f'target{index}{suffix}'
+        path.write_bytes(content)
+        targets.append(str(path))
+    return targets
+
+
+def build_stubs(root: Path) -> Path:
+    """Заглушки flatpak, snap, which, браузера и запускаемых приложений"""
+    bin_dir = root / 'bin'
+    bin_dir.mkdir(parents=True, exist_ok=True)
+
+    flatpak_rows = '\\n'.join(
+        f'Bench Flatpak {index}\\torg.bench.App{index}\\t1.0\\tstable\\tsystem' for index in range(FLATPAK_APPS)
+    )
+    write_stub(bin_dir, 'flatpak', f'printf "{flatpak_rows}\\n"')
+    snap_rows = '\\n'.join(f'bench-snap-{index}  1.0  {index}  latest/stable  bench  -' for index in range(SNAP_APPS))
+    write_stub(bin_dir, 'snap', f'printf "Name  Version  Rev  Tracking  Publisher  Notes\\n{snap_rows}\\n"')
+    write_stub(bin_dir, 'which', 'command -v "$1"')
+    write_stub(bin_dir, 'firefox')
+    write_stub(bin_dir, 'bench-app')
+    # Просмотрщик с окном: работает, пока его не закроют (BENCH_VIEWER_LIFETIME секунд)
+    write_stub(bin_dir, 'bench-viewer', 'exec sleep "${BENCH_VIEWER_LIFETIME:-5}"')
+    return bin_dir
+
+
+def build_backend_dirs(root: Path) -> dict:
+    """Директории установленных Flatpak и Snap приложений (проверка доступности без процессов)"""
+    flatpak_dir = root / 'flatpak' / 'app'
+    snap_dir = root / 'snap'
+    for index in range(FLATPAK_APPS):
+        (flatpak_dir / f'org.bench.App{index}').mkdir(parents=True, exist_ok=True)
+    for index in range(SNAP_APPS):
+        (snap_dir / f'bench-snap-{index}').mkdir(parents=True, exist_ok=True)
+    return {'flatpak': str(flatpak_dir), 'snap': str(snap_dir)}
+
+
+def build_environment(root: Path, count: int) -> dict:
+    """Полный набор данных и окружение для одного размера реестра"""
+    applications = build_xdg_tree(root, count)
+    home = build_home(root)
+    bin_dir = build_stubs(root)
+    backend_dirs = build_backend_dirs(root)
+    targets = build_targets(root)
+
+    env = dict(os.environ)
+    env.update({
+        'HOME': str(home),
+        'XDG_DATA_HOME': str(home / '.local' / 'share'),
+        'XDG_DATA_DIRS': str(applications.parent),
+        'XDG_CONFIG_HOME': str(home / '.config'),
+        'XDG_CACHE_HOME': str(home / '.cache'),
+        'XDG_RUNTIME_DIR': str(root),
+        'PATH': os.pathsep.join([str(bin_dir), '/usr/bin', '/bin']),
+        'BENCH_STUB_LOG': str(root / 'stub-calls.log'),
+        'LANG': 'ru_RU.UTF-8',
+    })
+    for name in ('CURSOR_SESSION', 'VSCODE_PID', 'TERMINAL'):
+        env.pop(name, None)
+    return {
+        'env': env,
+        'root': str(root),
+        'home': str(home),
+        'applications': str(applications),
+        'backend_dirs': backend_dirs,
+        'targets': targets,
+    }
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бюджет времени импорта open-with-chooser
+
+Каждый замер выполняется в отдельном интерпретаторе. Скрипт завершается с
+кодом 1, если медиана превышает бюджет или при импорте загружается GTK.
+
+Использование: python3 benchmarks/import_time.py [--budget-ms 80] [--runs 7]
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from common import CHOOSER_PATH
+
+PROBE = """
+import json, sys, time, importlib.util
+start = time.perf_counter()
+spec = importlib.util.spec_from_file_location('open_with_chooser', {path!r})
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+elapsed = (time.perf_counter() - start) * 1000
+print(json.dumps({{'import_ms': elapsed, 'gtk_loaded': 'gi' in sys.modules}}))
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Проверка бюджета времени импорта')
+    parser.add_argument('--budget-ms', type=float, default=80.0)
+    parser.add_argument('--runs', type=int, default=7)
+    args = parser.parse_args()
+
+    samples = []
+    gtk_loaded = False
+    for _ in range(args.runs):
+        result = subprocess.run(
+            [sys.executable, '-c', PROBE.format(path=str(CHOOSER_PATH))],
+            capture_output=True, text=True, check=True
+        )
+        data = json.loads(result.stdout.strip().splitlines()[-1])
+        samples.append(data['import_ms'])
+        gtk_loaded = gtk_loaded or data['gtk_loaded']
+
+    median = statistics.median(samples)
+    print(json.dumps({
+        'import_ms_median': round(median, 2),
+        'import_ms_min': round(min(samples), 2),
+        'budget_ms': args.budget_ms,
+        'gtk_loaded': gtk_loaded
+    }, indent=2))
+
+    if gtk_loaded:
+        print("❌ GTK загружается при импорте", file=sys.stderr)
+        sys.exit(1)
+    if median > args.budget_ms:
+        print(f"❌ Импорт занимает {median:.1f} мс при бюджете {args.budget_ms} мс", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
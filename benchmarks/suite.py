@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Офлайн набор бенчмарков Open-with-chooser
+
+Для каждого размера реестра (по умолчанию 100, 1000 и 10000 .desktop файлов)
+генерирует синтетическое дерево XDG, домашнюю директорию для поиска Tor Browser
+и заглушки flatpak/snap/which с задержкой, затем в отдельном процессе (HOME и
+XDG переменные фиксируются при импорте модуля) замеряет:
+
+- AppDiscovery.discover_all: холодный (без кэшей) и с кэшем реестра
+- AppDiscovery._check_apps_availability
+- OpenWithChooser.get_mime_type и пакетное определение MIME типов
+- AppChooserDialog._filter_and_sort_apps (без дисплея)
+- запуск по запомненному выбору целиком (OpenWithChooser.choose_and_run)
+- запуск приложения с %f для большего числа файлов, чем LAUNCH_CONCURRENCY, когда
+  запущенные окна не закрываются: все файлы должны открыться за ограниченное время
+
+Результаты пишутся в JSON. С --baseline скрипт завершается с кодом 1, если
+медиана какой-либо метрики выросла больше допустимого.
+
+Использование: python3 benchmarks/suite.py [--sizes 100,1000,10000] [--repeat 5]
+               [--stub-delay 0.05] [--output results.json]
+               [--baseline old.json] [--tolerance 0.25] [--min-delta-ms 2]
+"""
+
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from common import load_chooser, measure
+from fixtures import build_environment
+
+RESULTS_VERSION = 1
+
+
+def stub_calls(log_path: str) -> dict:
+    """Число вызовов каждой заглушки"""
+    calls = {}
+    try:
+        with open(log_path, 'r') as f:
+            for line in f:
+                name = line.split(' ', 1)[0].strip()
+                calls[name] = calls.get(name, 0) + 1
+    except FileNotFoundError:
+        pass
+    return calls
+
+
+def check_launch_queue(chooser, runner, log_path: str, targets: list) -> dict:
+    """Запуск %f приложения для многих файлов, когда процессы не завершаются"""
+    files = targets[:chooser.LAUNCH_CONCURRENCY * 3 + 1]
+    app = chooser.DesktopApp('Bench Viewer', 'bench-viewer %f')
+    before = stub_calls(log_path).get('bench-viewer', 0)
+    started = time.perf_counter()
+    runner.run_app(app, files)
+    for thread in threading.enumerate():
+        if thread.name == 'launch-queue':
+            thread.join()
+    elapsed = time.perf_counter() - started
+    # Очередь не ждёт закрытия окон: все файлы открыты за число партий * LAUNCH_STAGGER
+    batches = -(-len(files) // chooser.LAUNCH_CONCURRENCY)
+    return {
+        'launch_queue_files': len(files),
+        'launch_queue_started': stub_calls(log_path).get('bench-viewer', 0) - before,
+        'launch_queue_ms': round(elapsed * 1000, 1),
+        'launch_queue_bounded': elapsed < batches * chooser.LAUNCH_STAGGER + 1.0
+    }
+
+
+def run_worker(spec_path: str):
+    """Замеры для одного размера; выполняется в процессе с окружением из fixtures"""
+    with open(spec_path, 'r') as f:
+        spec = json.load(f)
+    repeat = spec['repeat']
+    log_path = spec['env']['BENCH_STUB_LOG']
+
+    chooser = load_chooser()
+    # Только синтетические данные: системные директории приложений и /opt не сканируются
+    applications = Path(spec['applications'])
+    chooser.AppDiscovery._desktop_dirs = lambda self: [applications]
+    chooser.FLATPAK_APP_DIRS = [Path(spec['backend_dirs']['flatpak'])]
+    chooser.SNAP_MOUNT_DIR = Path(spec['backend_dirs']['snap'])
+    chooser.TOR_SCAN_ROOTS = [(Path(spec['home']), 4)]
+
+    results = {'has_xdg': chooser.HAS_XDG}
+
+    discovery = chooser.AppDiscovery()
+
+    def discover_cold():
+        discovery.rescan = True
+        discovery.discover_all()
+
+    def discover_warm():
+        discovery.rescan = False
+        discovery.discover_all()
+
+    results['discover_all_cold'] = measure(discover_cold, repeat)
+    discover_warm()
+    results['discover_all_warm'] = measure(discover_warm, repeat)
+    results['apps'] = len(discovery.apps)
+
+    def check_availability():
+        for app in discovery.apps.values():
+            app.is_available = None
+        discovery._check_apps_availability()
+
+    results['check_apps_availability'] = measure(check_availability, repeat)
+
+    targets = spec['targets']
+    results['mime_detect_batch_cold'] = measure(
+        lambda: chooser.MimeDetector(cache_file=Path(spec['root']) / f'mime-{time.monotonic_ns()}.json').detect(targets),
+        repeat
+    )
+    runner = chooser.OpenWithChooser()
+    runner.get_mime_type(targets[0])
+    results['get_mime_type'] = measure(lambda: [runner.get_mime_type(target) for target in targets], repeat)
+    results['mime_targets'] = len(targets)
+
+    # Диалог без GTK: нужны только данные, которые использует фильтрация
+    dialog = chooser.AppChooserDialog.__new__(chooser.AppChooserDialog)
+    dialog.apps = discovery.apps
+    dialog.targets = [targets[0]]
+    dialog.mime_type = 'text/plain'
+    dialog.mime_index = discovery.mime_index
+    dialog.relevance = chooser.RelevanceRules()
+    dialog.target_class = dialog.relevance.target_class(dialog.targets[0], dialog.mime_type)
+    dialog.priorities = {}
+    dialog._candidates = set()
+    results['filter_and_sort_apps'] = measure(dialog._filter_and_sort_apps, repeat)
+
+    # Запуск по запомненному выбору: новый процесс каждый раз читает конфигурацию заново
+    target = targets[0]
+    mime_type = runner.get_mime_type(target)
+    context = runner.context_detector.get_invoker_context()
+    app = next(app for app in discovery.apps.values()
+               if app.desktop_file and app.main_command == 'bench-app')
+    runner.config_manager.set_context_choice(context, mime_type, app)
+    runner.config_manager.save_config()
+
+    launches_before = stub_calls(log_path).get('bench-app', 0)
+    results['remembered_choice'] = measure(lambda: chooser.OpenWithChooser().choose_and_run([target]), repeat)
+    # Быстрый путь не должен загружать GTK или запускать полное обнаружение
+    results['remembered_choice_fast_path'] = 'gi' not in sys.modules
+    results['stub_calls'] = stub_calls(log_path)
+    results['remembered_choice_launches'] = results['stub_calls'].get('bench-app', 0) - launches_before
+    results.update(check_launch_queue(chooser, runner, log_path, targets))
+
+    print(json.dumps(results))
+
+
+def run_size(size: int, args) -> dict:
+    """Генерация данных и запуск замеров в отдельном процессе"""
+    with tempfile.TemporaryDirectory(prefix=f'owc-bench-{size}-') as tmp:
+        started = time.perf_counter()
+        spec = build_environment(Path(tmp), size)
+        spec['repeat'] = args.repeat
+        spec['env']['BENCH_STUB_DELAY'] = str(args.stub_delay)
+        fixture_ms = round((time.perf_counter() - started) * 1000, 1)
+
+        spec_path = Path(tmp) / 'spec.json'
+        spec_path.write_text(json.dumps(spec))
+        result = subprocess.run(
+            [sys.executable, __file__, '--worker', str(spec_path)],
+            env=spec['env'], capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"Замеры для {size} записей завершились с ошибкой:\n{result.stderr}")
+        metrics = json.loads(result.stdout.strip().splitlines()[-1])
+        metrics['fixture_ms'] = fixture_ms
+        return metrics
+
+
+def compare(results: dict, baseline: dict, tolerance: float, min_delta_ms: float) -> list:
+    """Метрики, медиана которых выросла больше допустимого относительно базовой"""
+    regressions = []
+    for size, metrics in results['sizes'].items():
+        base_metrics = baseline.get('sizes', {}).get(size, {})
+        for name, value in metrics.items():
+            base = base_metrics.get(name)
+            if not isinstance(value, dict) or not isinstance(base, dict) or 'median_ms' not in value:
+                continue
+            current_ms = value['median_ms']
+            base_ms = base['median_ms']
+            if current_ms > base_ms * (1 + tolerance) and current_ms - base_ms > min_delta_ms:
+                regressions.append({
+                    'size': size,
+                    'metric': name,
+                    'baseline_ms': base_ms,
+                    'current_ms': current_ms
+                })
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Офлайн бенчмарки open-with-chooser')
+    parser.add_argument('--sizes', default='100,1000,10000', help='Размеры реестра через запятую')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--stub-delay', type=float, default=0.05, help='Задержка заглушек flatpak/snap/which, секунды')
+    parser.add_argument('--output', help='Файл для результатов JSON (по умолчанию stdout)')
+    parser.add_argument('--baseline', help='Результаты предыдущей версии для сравнения')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Допустимый относительный рост медианы')
+    parser.add_argument('--min-delta-ms', type=float, default=2.0, help='Рост меньше этого не считается регрессией')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker)
+        return
+
+    results = {
+        'version': RESULTS_VERSION,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'params': {'repeat': args.repeat, 'stub_delay': args.stub_delay},
+        'sizes': {}
+    }
+    for size in (int(value) for value in args.sizes.split(',') if value):
+        results['sizes'][str(size)] = run_size(size, args)
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        results['regressions'] = compare(results, baseline, args.tolerance, args.min_delta_ms)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + '\n')
+    else:
+        print(output)
+
+    failed = False
+    for size, metrics in results['sizes'].items():
+        if not metrics['remembered_choice_fast_path'] or not metrics['remembered_choice_launches']:
+            print(f"Запомненный выбор ({size} записей) не прошёл по быстрому пути", file=sys.stderr)
+            failed = True
+        if (metrics['launch_queue_started'] != metrics['launch_queue_files']
+                or not metrics['launch_queue_bounded']):
+            print(f"Очередь запуска ({size} записей): открыто {metrics['launch_queue_started']} из "
+                  f"{metrics['launch_queue_files']} файлов за {metrics['launch_queue_ms']} мс", file=sys.stderr)
+            failed = True
+    for regression in results.get('regressions', []):
+        print(f"Регрессия {regression['metric']} ({regression['size']} записей): "
+              f"{regression['baseline_ms']} -> {regression['current_ms']} мс", file=sys.stderr)
+        failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
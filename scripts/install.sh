@@ -102,6 +102,14 @@ cp "$SCRIPT_FILE" "$INSTALL_DIR/open-with-chooser"
 chmod +x "$INSTALL_DIR/open-with-chooser"
 echo "✅ Установлен: $INSTALL_DIR/open-with-chooser"
 
+# Тонкий клиент резидентного режима (лежит рядом с основным скриптом)
+CLIENT_FILE="$(dirname "$SCRIPT_FILE")/open-with-chooser-client.py"
+if [ -f "$CLIENT_FILE" ]; then
+    cp "$CLIENT_FILE" "$INSTALL_DIR/open-with-chooser-client"
+    chmod +x "$INSTALL_DIR/open-with-chooser-client"
+    echo "✅ Установлен: $INSTALL_DIR/open-with-chooser-client"
+fi
+
 # Desktop файл
 echo "🖥️ Создание .desktop файла..."
 cat > "$DESKTOP_DIR/open-with-chooser.desktop" << 'EOF'
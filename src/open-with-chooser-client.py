@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Open-with-chooser client - Тонкий клиент резидентного режима
+
+Передаёт argv, рабочую директорию и окружение запущенному демону
+(open-with-chooser --daemon) через Unix сокет и сразу завершается.
+Если демон не запущен, управление передаётся обычному open-with-chooser.
+"""
+
+import os
+import sys
+import json
+import shutil
+import socket
+from pathlib import Path
+
+# Должен совпадать с SOCKET_PATH в open-with-chooser.py
+CACHE_DIR = Path.home() / '.cache' / 'open-with-chooser'
+SOCKET_PATH = Path(os.environ.get('XDG_RUNTIME_DIR') or CACHE_DIR) / 'open-with-chooser.sock'
+CONNECT_TIMEOUT = 2
+
+
+def send_request(argv) -> bool:
+    """Отправка запроса демону; True, если демон принял запрос"""
+    request = {
+        'argv': argv,
+        'cwd': os.getcwd(),
+        'env': dict(os.environ),
+        # Контекст вызова определяется по родителю клиента: к обработке запроса
+        # сам клиент уже завершится
+        'ppid': os.getppid()
+    }
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(CONNECT_TIMEOUT)
+            sock.connect(str(SOCKET_PATH))
+            sock.sendall(json.dumps(request).encode('utf-8'))
+            sock.shutdown(socket.SHUT_WR)
+            reply = sock.recv(16)
+        return reply.startswith(b'ok')
+    except OSError:
+        return False
+
+
+def find_chooser():
+    """Поиск полного open-with-chooser для запуска без демона"""
+    script_dir = Path(__file__).resolve().parent
+    for name in ('open-with-chooser', 'open-with-chooser.py'):
+        candidate = script_dir / name
+        if candidate.is_file():
+            return str(candidate)
+    return shutil.which('open-with-chooser')
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Использование: open-with-chooser-client <url|файл> [файл2] ...")
+        sys.exit(1)
+
+    if send_request(sys.argv[1:]):
+        return
+
+    # Демон не запущен: выполняем выбор в этом процессе
+    chooser = find_chooser()
+    if not chooser:
+        print("open-with-chooser не найден", file=sys.stderr)
+        sys.exit(1)
+    os.execv(sys.executable, [sys.executable, chooser] + sys.argv[1:])
+
+
+if __name__ == "__main__":
+    main()
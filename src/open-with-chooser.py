@@ -15,23 +15,25 @@ Open-with-chooser Enhanced - Улучшенный селектор прилож
 import os
 import sys
 import json
+import math
 import logging
+import argparse
+import fcntl
+import signal
 import subprocess
-import shlex
+import threading
+import concurrent.futures
+import queue
+import functools
+import re
 import tempfile
 import stat
-import hashlib
 import time
+from collections import OrderedDict
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple, Any
-from urllib.parse import urlparse
-import gi
-
-gi.require_version('Gtk', '3.0')
-from gi.repository import Gtk, GLib, GdkPixbuf, Gdk
+from typing import Callable, Dict, List, Optional, Set, Tuple, Any
 
 try:
-    from xdg.DesktopEntry import DesktopEntry
     from xdg.BaseDirectory import xdg_data_dirs, xdg_config_home
     from xdg import Mime
     HAS_XDG = True
@@ -42,146 +44,743 @@ except ImportError:
 CONFIG_DIR = Path.home() / '.config' / 'open-with-chooser'
 BIN_DIR = Path.home() / '.local' / 'share' / 'open-with-chooser' / 'bin'
 CONFIG_FILE = CONFIG_DIR / 'chooser.json'
+CONFIG_LOCK_FILE = CONFIG_DIR / '.chooser.lock'
+USAGE_DB_FILE = CONFIG_DIR / 'chooser.db'
 LOG_FILE = CONFIG_DIR / 'chooser.log'
+LOG_MAX_BYTES = 1024 * 1024  # Размер chooser.log, после которого файл ротируется
+LOG_BACKUP_COUNT = 3  # Хранимых старых файлов журнала
+LOG_LEVEL_ENV = 'OPEN_WITH_CHOOSER_LOG_LEVEL'  # Уровень журнала (важнее log_level из конфигурации)
+LOG_DEFAULT_LEVEL = 'WARNING'  # Успешный запуск ничего не пишет в журнал
+CACHE_DIR = Path.home() / '.cache' / 'open-with-chooser'
+REGISTRY_CACHE_FILE = CACHE_DIR / 'registry.json'
+REGISTRY_CACHE_VERSION = 6
+FLATPAK_APP_DIRS = [
+    Path('/var/lib/flatpak/app'),
+    Path.home() / '.local/share/flatpak/app'
+]
+SNAP_MOUNT_DIR = Path('/snap')
+DISCOVERY_TIMEOUT = 2.0  # Общий бюджет времени источников обнаружения, секунды
+LAUNCH_CONCURRENCY = 4  # Процессов приложения с %f/%u, запускаемых без паузы
+LAUNCH_STAGGER = 0.5  # Наибольшая пауза перед следующими запусками, если ни один процесс не завершился
+LAUNCH_POLL_INTERVAL = 0.02  # Период проверки завершения запущенных процессов, секунды
+ARG_MAX_MARGIN = 4096  # Запас к ARG_MAX при разбиении длинных списков файлов
+SEARCH_DEBOUNCE_MS = 150  # Задержка применения поиска после последнего нажатия
+ICON_SIZE = 24  # Размер иконок в списке приложений, пиксели
+ICON_CACHE_SIZE = 256  # Число декодированных иконок в памяти
+ICON_CACHE_DIR = CACHE_DIR / 'icons'
+MIME_CACHE_FILE = CACHE_DIR / 'mime.json'
+MIME_CACHE_SIZE = 1024  # Файлов в кэше определённых по содержимому MIME типов
+MIME_SNIFF_CONCURRENCY = 4  # Файлов, читаемых одновременно для определения по содержимому
+FRECENCY_HALF_LIFE = 14 * 24 * 3600  # Вес использования уменьшается вдвое за две недели
+FRECENCY_MIN_SCORE = 0.05  # Записи с меньшей оценкой удаляются при компактизации
+FRECENCY_MAX_APPS = 256  # Приложений в общей статистике
+FRECENCY_MAX_CONTEXTS = 128  # Пар (контекст, MIME тип) в статистике
+FRECENCY_MAX_CONTEXT_APPS = 16  # Приложений на одну пару (контекст, MIME тип)
+FRECENCY_GLOBAL_WEIGHT = 0.25  # Вклад общей статистики относительно статистики контекста
+FRECENCY_FREQUENT = 5.0  # Оценка "часто используемого" (несколько раз в неделю)
+FRECENCY_RECOMMENDED = 1.5  # Оценка "рекомендуемого"
+# Правила определения контекста по родительским процессам: регулярное выражение
+# для имени процесса (comm) или командной строки (cmdline); max_depth ограничивает
+# глубину предка (1 — непосредственный родитель). Первое совпадение по ближайшему
+# предку определяет контекст; правила context_rules из конфигурации проверяются раньше.
+# Правила с fallback применяются, только если обычные не совпали ни с одним предком
+# (оболочка во встроенном терминале IDE не перекрывает саму IDE).
+DEFAULT_CONTEXT_RULES = [
+    {'context': 'cursor', 'comm': 'cursor'},
+    {'context': 'vscode', 'comm': 'code'},
+    {'context': 'terminal', 'comm': 'terminal|konsole'},
+    {'context': 'filemanager', 'comm': 'nautilus|dolphin|thunar|nemo'},
+    {'context': 'terminal', 'comm': 'bash|zsh', 'max_depth': 1, 'fallback': True},
+    # AppImage запускается как AppRun, имя приложения видно только в командной строке
+    {'context': 'cursor', 'cmdline': r'cursor[^/ ]*\.appimage'},
+]
+CONTEXT_MAX_DEPTH = 32  # Предков, просматриваемых при определении контекста
+CONTEXT_CACHE_SIZE = 256  # Родительских процессов в кэше контекста (резидентный режим)
+# Правила релевантности приложений для класса цели (web, image, video, audio, pdf):
+# prefer делает приложение рекомендуемым, exclude скрывает его для этого класса
+# (exclude сильнее prefer). Правило срабатывает, если совпало любое из полей:
+# подстрока имени (names), категория из Categories= (categories) или ключевое
+# слово из Keywords= (keywords). Правила relevance_rules из конфигурации добавляются.
+DEFAULT_RELEVANCE_RULES = [
+    {'target': 'web', 'effect': 'exclude',
+     'names': ['gimp', 'inkscape', 'blender', 'audacity', 'libreoffice calc', 'libreoffice impress']},
+    {'target': 'web', 'effect': 'prefer',
+     'names': ['firefox', 'chrome', 'chromium', 'browser'], 'categories': ['WebBrowser']},
+    {'target': 'image', 'effect': 'prefer',
+     'names': ['gimp', 'image', 'photo', 'viewer', 'paint'], 'categories': ['RasterGraphics', 'Photography']},
+    {'target': 'image', 'effect': 'exclude',
+     'names': ['writer', 'calc', 'impress', 'text editor'],
+     'categories': ['TextEditor', 'WordProcessor', 'Spreadsheet', 'Presentation']},
+    {'target': 'video', 'effect': 'prefer',
+     'names': ['vlc', 'player', 'video', 'mpv', 'totem'], 'categories': ['Video']},
+    {'target': 'video', 'effect': 'exclude', 'names': ['gimp', 'inkscape', 'image viewer']},
+    {'target': 'audio', 'effect': 'prefer',
+     'names': ['rhythmbox', 'vlc', 'player', 'audio', 'music'], 'categories': ['Audio', 'Music']},
+    {'target': 'pdf', 'effect': 'prefer', 'names': ['evince', 'okular', 'reader', 'pdf', 'document viewer']},
+]
+TOR_LOCATIONS_FILE = CACHE_DIR / 'tor-browser.json'
+TOR_SCAN_TTL = 14 * 24 * 3600  # Полное пересканирование не чаще раза в две недели
+# Корни поиска Tor Browser и максимальная глубина обхода для каждого
+TOR_SCAN_ROOTS = [
+    (Path.home(), 4),
+    (Path.home() / '.local/share/torbrowser', 6),  # torbrowser-launcher
+    (Path('/opt'), 3)
+]
+TOR_SCAN_EXCLUDED_DIRS = {
+    'node_modules', '.git', '.hg', '.svn', '__pycache__', 'venv', '.venv',
+    'site-packages', 'target', 'build', 'dist', 'snap', 'Trash'
+}
+NETWORK_FS_TYPES = {
+    'nfs', 'nfs4', 'cifs', 'smbfs', 'smb3', 'fuse.sshfs', 'sshfs', 'davfs',
+    'fuse.davfs2', 'fuse.rclone', 'fuse.gvfsd-fuse', 'afs', '9p', 'ceph', 'glusterfs'
+}
+SOCKET_PATH = Path(os.environ.get('XDG_RUNTIME_DIR') or CACHE_DIR) / 'open-with-chooser.sock'
+PROFILE_ENV = 'OPEN_WITH_CHOOSER_PROFILE'  # Путь к файлу трассировки (или 1 для пути по умолчанию)
+PROFILE_MAX_EVENTS = 100000  # Ограничение трассировки резидентного режима
+EXIT_NO_CHOICE = 3  # Код возврата --launch-remembered, если для цели нет запомненного выбора
 
-# Создание директорий
-CONFIG_DIR.mkdir(parents=True, exist_ok=True)
-BIN_DIR.mkdir(parents=True, exist_ok=True)
-
-# Логирование
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(LOG_FILE),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
+class Tracer:
+    """Интервалы выполнения в формате Chrome Trace Event (chrome://tracing, Perfetto)"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.events = []
+        self.thread_names = {}
+        self.origin = time.perf_counter_ns()
+        self.pid = os.getpid()
+
+    def add(self, name: str, start: int, end: int, args: Dict[str, Any]):
+        """Запись завершённого интервала (времена из time.perf_counter_ns)"""
+        if len(self.events) >= PROFILE_MAX_EVENTS:
+            return
+        thread = threading.current_thread()
+        self.thread_names[thread.ident] = thread.name
+        event = {
+            'name': name,
+            'ph': 'X',
+            'ts': (start - self.origin) / 1000,
+            'dur': (end - start) / 1000,
+            'pid': self.pid,
+            'tid': thread.ident
+        }
+        if args:
+            event['args'] = args
+        # list.append атомарен: интервалы приходят и из рабочих потоков
+        self.events.append(event)
+
+    def save(self):
+        """Запись трассировки с именами потоков"""
+        metadata = [
+            {'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': tid, 'args': {'name': name}}
+            for tid, name in list(self.thread_names.items())
+        ]
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, 'w') as f:
+                json.dump({'traceEvents': metadata + list(self.events), 'displayTimeUnit': 'ms'}, f)
+            logger.info(f"Трассировка записана: {self.path}")
+        except Exception as e:
+            logger.error(f"Ошибка записи трассировки: {e}")
+
+class _Span:
+    """Интервал трассировки для with"""
+    __slots__ = ('tracer', 'name', 'args', 'start')
+
+    def __init__(self, tracer: Tracer, name: str, args: Dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.tracer.add(self.name, self.start, time.perf_counter_ns(), self.args)
+        return False
+
+class _NullSpan:
+    """Пустой интервал, когда трассировка выключена"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_NULL_SPAN = _NullSpan()
+_tracer = None  # Tracer, если включён --profile или OPEN_WITH_CHOOSER_PROFILE
+
+def _span(name: str, **args):
+    """Интервал трассировки; без профилирования — общий пустой объект"""
+    tracer = _tracer
+    if tracer is None:
+        return _NULL_SPAN
+    return _Span(tracer, name, args)
+
+def _record_span(name: str, start: int, **args):
+    """Интервал от start (time.perf_counter_ns) до текущего момента"""
+    tracer = _tracer
+    if tracer is not None:
+        tracer.add(name, start, time.perf_counter_ns(), args)
+
+def _traced(name: str):
+    """Декоратор: вызов функции записывается как интервал трассировки"""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            tracer = _tracer
+            if tracer is None:
+                return func(*args, **kwargs)
+            with _Span(tracer, name, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def _enable_profiling(path: Optional[str]):
+    """Включение трассировки; файл записывается при выходе из процесса"""
+    global _tracer
+    import atexit
+    if not path or path == '1':
+        path = str(CACHE_DIR / f'trace-{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}.json')
+    _tracer = Tracer(Path(path).expanduser())
+    atexit.register(_tracer.save)
+
+# GTK загружается лениво: запуск запомненного выбора интерфейс не показывает
+Gtk = GLib = GdkPixbuf = Gdk = None
+
+def _import_gtk():
+    """Загрузка GTK при первом обращении к интерфейсу"""
+    global Gtk, GLib, GdkPixbuf, Gdk
+    if Gtk is not None:
+        return
+    with _span('gtk.import'):
+        import gi
+        gi.require_version('Gtk', '3.0')
+        from gi.repository import Gtk as _Gtk, GLib as _GLib, GdkPixbuf as _GdkPixbuf, Gdk as _Gdk
+    Gtk, GLib, GdkPixbuf, Gdk = _Gtk, _GLib, _GdkPixbuf, _Gdk
+
+# Поток записи журнала в файл; создаётся в main(), при импорте модуля логирование не настраивается
+_log_listener = None
+
+def _setup_environment():
+    """Создание директорий и настройка логирования (при запуске, а не при импорте)"""
+    CONFIG_DIR.mkdir(parents=True, exist_ok=True)
+    BIN_DIR.mkdir(parents=True, exist_ok=True)
+    _setup_logging()
+
+def _setup_logging():
+    """Журнал с ротацией по размеру; файл пишет отдельный поток через очередь"""
+    global _log_listener
+    import atexit
+    from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+    
+    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    # delay: файл открывается только при первой записи
+    file_handler = RotatingFileHandler(LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT,
+                                       encoding='utf-8', delay=True)
+    file_handler.setFormatter(formatter)
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(formatter)
+    
+    log_queue = queue.SimpleQueue()
+    _log_listener = QueueListener(log_queue, file_handler)
+    _log_listener.start()
+    # Остаток очереди дописывается при выходе
+    atexit.register(_stop_logging)
+    
+    root = logging.getLogger()
+    root.handlers = [QueueHandler(log_queue), stream_handler]
+    _set_log_level()
+
+def _stop_logging():
+    """Запись оставшихся сообщений и остановка потока журнала"""
+    global _log_listener
+    listener, _log_listener = _log_listener, None
+    if listener is not None:
+        listener.stop()
+
+def _set_log_level(configured: Optional[str] = None):
+    """Уровень журнала: переменная окружения, затем log_level из конфигурации, иначе WARNING"""
+    if _log_listener is None:
+        # Модуль используется как библиотека: чужую настройку логирования не трогаем
+        return
+    logging.getLogger().setLevel(_log_level(os.environ.get(LOG_LEVEL_ENV) or configured or LOG_DEFAULT_LEVEL))
+
+@functools.lru_cache(maxsize=None)
+def _log_level(name: str) -> int:
+    """Числовой уровень журнала по имени; о неизвестном имени сообщается один раз"""
+    level = logging.getLevelName(str(name).upper())
+    if not isinstance(level, int):
+        logger.warning(f"Неизвестный уровень журнала: {name}")
+        level = logging.getLevelName(LOG_DEFAULT_LEVEL)
+    return level
+
+def _path_mtime(path) -> Optional[int]:
+    """mtime пути в наносекундах или None, если путь недоступен"""
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+def _argv_size(args: List[str]) -> int:
+    """Место, занимаемое аргументами в памяти execve: строки с нулём и указатели"""
+    return sum(len(os.fsencode(arg)) + 1 + 8 for arg in args)
+
+def _argv_budget(environ: Optional[Dict[str, str]] = None) -> int:
+    """Доступный объём аргументов одного запуска с учётом окружения"""
+    try:
+        arg_max = os.sysconf('SC_ARG_MAX')
+    except (ValueError, OSError):
+        arg_max = 131072
+    env = os.environ if environ is None else environ
+    env_size = sum(len(os.fsencode(key)) + len(os.fsencode(value)) + 2 + 8 for key, value in env.items())
+    return arg_max - env_size - ARG_MAX_MARGIN
+
+def _frecency_score(value: Optional[float], now: float) -> float:
+    """Текущая оценка frecency по сохранённому значению
+
+    Frecency хранится как момент t, для которого оценка равна
+    2 ** ((t - now) / FRECENCY_HALF_LIFE): порядок записей по t совпадает
+    с порядком по оценке, поэтому хранимые значения не пересчитываются со временем.
+    """
+    if value is None:
+        return 0.0
+    return 2.0 ** ((value - now) / FRECENCY_HALF_LIFE)
+
+def _frecency_add(value: Optional[float], now: float) -> float:
+    """Добавление одного использования к сохранённому значению frecency"""
+    return now + FRECENCY_HALF_LIFE * math.log2(_frecency_score(value, now) + 1)
+
+def _frecency_threshold(now: float) -> float:
+    """Сохранённое значение, ниже которого оценка меньше FRECENCY_MIN_SCORE"""
+    return now + FRECENCY_HALF_LIFE * math.log2(FRECENCY_MIN_SCORE)
+
+def _legacy_frecency(count: int, last_used: int) -> float:
+    """Frecency для старой статистики: count использований в момент last_used"""
+    return last_used + FRECENCY_HALF_LIFE * math.log2(max(count, 1))
+
+class ExecutableIndex:
+    """Индекс исполняемых файлов из PATH: один scandir на директорию вместо вызовов which"""
+    _indexes = {}  # значение PATH -> ExecutableIndex
+    _lock = threading.Lock()
+
+    def __init__(self, path_value: str):
+        self.directories = [d for d in path_value.split(os.pathsep) if d]
+        self.entries = {}  # имя -> пути кандидатов в порядке PATH
+        self.mtimes = []
+        self._resolved = {}
+        self._build()
+
+    @classmethod
+    @_traced('path_index')
+    def for_path(cls, path_value: Optional[str] = None, revalidate: bool = False) -> 'ExecutableIndex':
+        """Индекс для значения PATH (по умолчанию текущего), построенный не более одного раза
+
+        revalidate перестраивает индекс, если какая-либо директория PATH изменилась.
+        """
+        if path_value is None:
+            path_value = os.environ.get('PATH', os.defpath)
+        with cls._lock:
+            index = cls._indexes.get(path_value)
+            if index is None or (revalidate and index.is_stale()):
+                index = cls._indexes[path_value] = cls(path_value)
+            return index
+
+    def _build(self):
+        """Построение индекса имён файлов по всем директориям PATH"""
+        for directory in self.directories:
+            self.mtimes.append(_path_mtime(directory))
+            try:
+                with os.scandir(directory) as it:
+                    for entry in it:
+                        self.entries.setdefault(entry.name, []).append(entry.path)
+            except OSError:
+                continue
+
+    def is_stale(self) -> bool:
+        """Проверка, менялись ли директории PATH после построения индекса"""
+        return [_path_mtime(d) for d in self.directories] != self.mtimes
+
+    def resolve(self, command: str) -> Optional[str]:
+        """Полный путь к исполняемому файлу, как его нашёл бы which"""
+        if os.sep in command:
+            return command if os.path.isfile(command) and os.access(command, os.X_OK) else None
+        
+        if command not in self._resolved:
+            resolved = None
+            # Права проверяются только у найденных по имени кандидатов
+            for candidate in self.entries.get(command, ()):
+                if os.path.isfile(candidate) and os.access(candidate, os.X_OK):
+                    resolved = candidate
+                    break
+            self._resolved[command] = resolved
+        return self._resolved[command]
+
+    def __contains__(self, command: str) -> bool:
+        return self.resolve(command) is not None
+
+def _desktop_locales() -> List[str]:
+    """Варианты текущей локали в порядке приоритета для ключей вида Name[ru_RU]"""
+    for var in ('LC_ALL', 'LC_MESSAGES', 'LANG'):
+        value = os.environ.get(var)
+        if value:
+            break
+    else:
+        return []
+    if value in ('C', 'POSIX'):
+        return []
+    
+    # lang_COUNTRY.ENCODING@MODIFIER -> lang_COUNTRY@MODIFIER, lang_COUNTRY, lang@MODIFIER, lang
+    value, _, modifier = value.partition('@')
+    value = value.split('.', 1)[0]
+    lang, _, country = value.partition('_')
+    candidates = []
+    if country and modifier:
+        candidates.append(f'{lang}_{country}@{modifier}')
+    if country:
+        candidates.append(f'{lang}_{country}')
+    if modifier:
+        candidates.append(f'{lang}@{modifier}')
+    candidates.append(lang)
+    return candidates
+
+class DesktopEntryParser:
+    """Потоковый разбор группы [Desktop Entry] без полной валидации файла"""
+    GROUP_HEADER = '[Desktop Entry]'
+    BLOCK_SIZE = 8192
+    # Ключи, которые нужны реестру; остальные строки группы не разбираются
+    KEYS = ('Type', 'Name', 'GenericName', 'Keywords', 'Categories', 'Exec', 'TryExec', 'Icon',
+            'MimeType', 'Hidden', 'NoDisplay')
+    LOCALIZED_KEYS = {'Name', 'GenericName', 'Comment', 'Keywords'}
+    # Exec имеет собственные правила кавычек и разбирается отдельно
+    RAW_KEYS = {'Exec'}
+    ESCAPES = {'s': ' ', 'n': '\n', 't': '\t', 'r': '\r', '\\': '\\'}
+
+    def __init__(self, locales: Optional[List[str]] = None, keys: Optional[Tuple[str, ...]] = None):
+        self.locales = _desktop_locales() if locales is None else locales
+        # Для каждого ключа заранее готовятся искомые префиксы строк: сначала локализованные
+        self._tokens = []
+        for key in keys or self.KEYS:
+            tokens = []
+            if key in self.LOCALIZED_KEYS:
+                tokens.extend(f'\n{key}[{locale}]' for locale in self.locales)
+            tokens.append(f'\n{key}')
+            self._tokens.append((key, tokens, key in self.RAW_KEYS))
+
+    def _read_group(self, path) -> Optional[str]:
+        """Чтение файла блоками до конца группы [Desktop Entry]"""
+        header = self.GROUP_HEADER.encode()
+        with open(path, 'rb') as f:
+            data = f.read(self.BLOCK_SIZE)
+            eof = len(data) < self.BLOCK_SIZE
+            
+            while True:
+                start = 0 if data.startswith(header) else data.find(b'\n' + header)
+                if start != -1 or eof:
+                    break
+                chunk = f.read(self.BLOCK_SIZE)
+                eof = len(chunk) < self.BLOCK_SIZE
+                data += chunk
+            if start == -1:
+                return None
+            
+            # Группа заканчивается на заголовке следующей группы
+            body = data.find(b'\n', start + 1) + 1
+            while True:
+                end = data.find(b'\n[', body)
+                if end != -1 or eof:
+                    break
+                chunk = f.read(self.BLOCK_SIZE)
+                eof = len(chunk) < self.BLOCK_SIZE
+                data += chunk
+        group = data[body:] if end == -1 else data[body:end]
+        return group.decode('utf-8', 'replace')
+
+    def parse(self, path) -> Optional[Dict[str, str]]:
+        """Нужные ключи группы [Desktop Entry]; остальные группы не читаются"""
+        group = self._read_group(path)
+        if group is None:
+            return None
+        
+        group = '\n' + group
+        entry = {}
+        for key, tokens, raw in self._tokens:
+            for token in tokens:
+                value = self._find_value(group, token)
+                if value is not None:
+                    entry[key] = value if raw else self._unescape(value)
+                    break
+        return entry
+
+    @staticmethod
+    def _find_value(group: str, token: str) -> Optional[str]:
+        """Значение первой строки вида '<token> = значение' (поиск выполняется в C)"""
+        length = len(group)
+        pos = group.find(token)
+        while pos != -1:
+            eq = pos + len(token)
+            while eq < length and group[eq] in ' \t':
+                eq += 1
+            if eq < length and group[eq] == '=':
+                end = group.find('\n', eq)
+                return group[eq + 1:end if end != -1 else length].strip()
+            pos = group.find(token, pos + 1)
+        return None
+
+    @classmethod
+    def _unescape(cls, value: str) -> str:
+        """Раскрытие escape-последовательностей строковых значений"""
+        if '\\' not in value:
+            return value
+        result = []
+        chars = iter(value)
+        for char in chars:
+            if char == '\\':
+                following = next(chars, '')
+                result.append(cls.ESCAPES.get(following, '\\' + following))
+            else:
+                result.append(char)
+        return ''.join(result)
+
+    @staticmethod
+    def split_list(value: str) -> List[str]:
+        """Разбор списка значений, разделённых ';'"""
+        return [item.strip() for item in value.split(';') if item.strip()]
+
+class ExecTemplate:
+    """Компиляция строки Exec по спецификации Desktop Entry в шаблон argv
+
+    Шаблон — список аргументов; аргумент — список сегментов, в котором на
+    чётных местах стоят литералы, а на нечётных — коды полей без '%':
+    Exec=app --name=%c %F компилируется в [['app'], ['--name=', 'c', ''], ['', 'F', '']].
+    Шаблон сериализуется в JSON и хранится в кэше реестра.
+    """
+    FIELD_CODES = frozenset('fFuUick')
+    # Устаревшие коды (%d, %D, %n, %N, %v, %m) и неизвестные коды удаляются
+    QUOTED_ESCAPES = frozenset('"`$\\')
+    WHITESPACE = frozenset(' \t\n')
+
+    @classmethod
+    def compile(cls, exec_line: str) -> List[List[str]]:
+        """Разбор значения Exec (в том виде, в каком оно записано в файле); ValueError при ошибке кавычек"""
+        line = DesktopEntryParser._unescape(exec_line)
+        template = []
+        arg = None  # сегменты текущего аргумента
+        literal = []
+        dropped = False  # в аргументе был удалённый код поля
+        quote = None
+        chars = iter(line)
+        for char in chars:
+            if quote is None and char in cls.WHITESPACE:
+                if arg is not None:
+                    cls._finish_arg(template, arg, literal, dropped)
+                    arg = None
+                    literal = []
+                continue
+            if arg is None:
+                arg = []
+                dropped = False
+            
+            if char == '%':
+                code = next(chars, '')
+                if code == '%':
+                    literal.append('%')
+                elif code in cls.FIELD_CODES:
+                    arg.append(''.join(literal))
+                    arg.append(code)
+                    literal = []
+                else:
+                    dropped = True
+            elif quote == "'":
+                # Одинарные кавычки не входят в спецификацию, но встречаются (sh -c '...')
+                if char == "'":
+                    quote = None
+                else:
+                    literal.append(char)
+            elif quote == '"':
+                if char == '"':
+                    quote = None
+                elif char == '\\':
+                    following = next(chars, '')
+                    literal.append(following if following in cls.QUOTED_ESCAPES else '\\' + following)
+                else:
+                    literal.append(char)
+            elif char in '"\'':
+                quote = char
+            elif char == '\\':
+                literal.append(next(chars, ''))
+            else:
+                literal.append(char)
+        
+        if quote is not None:
+            raise ValueError(f"Незакрытая кавычка в Exec: {exec_line}")
+        if arg is not None:
+            cls._finish_arg(template, arg, literal, dropped)
+        return template
+
+    @staticmethod
+    def _finish_arg(template: List[List[str]], arg: List[str], literal: List[str], dropped: bool):
+        """Завершение аргумента; аргумент только из удалённых кодов (%d, %m ...) исчезает целиком"""
+        if dropped and not arg and not literal:
+            return
+        arg.append(''.join(literal))
+        template.append(arg)
+
+    @staticmethod
+    def target_mode(template: List[List[str]]) -> Optional[str]:
+        """'multiple' для %F/%U, 'single' для %f/%u, None если команда не принимает файлы
+
+        %F/%U внутри аргумента (--open=%U) раскрывается только в первую цель,
+        поэтому такая команда запускается на каждый файл отдельно.
+        """
+        mode = None
+        for arg in template:
+            standalone = len(arg) == 3 and not arg[0] and not arg[2]
+            for code in arg[1::2]:
+                if code in 'FU' and standalone:
+                    return 'multiple'
+                if code in 'fuFU':
+                    mode = 'single'
+        return mode
+
+    @staticmethod
+    def _target_value(target: str, code: str) -> str:
+        """%f/%F требуют локальный путь: file:// URI преобразуется в путь"""
+        if code in 'fF' and target.startswith('file://'):
+            from urllib.parse import unquote, urlparse
+            return unquote(urlparse(target).path)
+        return target
+
+    @classmethod
+    def expand(cls, template: List[List[str]], targets: List[str], name: str = '',
+               icon: str = '', desktop_file: str = '') -> List[str]:
+        """Подстановка целей и кодов полей за один проход по шаблону"""
+        argv = []
+        has_targets = False
+        for arg in template:
+            if len(arg) == 1:
+                argv.append(arg[0])
+                continue
+            
+            if len(arg) == 3 and not arg[0] and not arg[2]:
+                # Код поля — весь аргумент: может раскрыться в несколько аргументов или ни в один
+                code = arg[1]
+                if code in 'FU':
+                    has_targets = True
+                    argv.extend(cls._target_value(target, code) for target in targets)
+                elif code in 'fu':
+                    has_targets = True
+                    if targets:
+                        argv.append(cls._target_value(targets[0], code))
+                elif code == 'i':
+                    if icon:
+                        argv.extend(('--icon', icon))
+                elif code == 'c':
+                    argv.append(name)
+                elif code == 'k':
+                    if desktop_file:
+                        argv.append(desktop_file)
+                continue
+            
+            # Код внутри аргумента заменяется одним значением
+            parts = [arg[0]]
+            for index in range(1, len(arg), 2):
+                code = arg[index]
+                if code in 'fFuU':
+                    has_targets = True
+                    parts.append(cls._target_value(targets[0], code) if targets else '')
+                elif code == 'i':
+                    parts.append(icon)
+                elif code == 'c':
+                    parts.append(name)
+                elif code == 'k':
+                    parts.append(desktop_file)
+                parts.append(arg[index + 1])
+            argv.append(''.join(parts))
+        
+        # Команды без кодов полей (браузеры, пользовательские приложения) получают цели в конце
+        if not has_targets:
+            argv.extend(targets)
+        return argv
+
+    @staticmethod
+    def quote(arg: str) -> str:
+        """Запись аргумента в виде значения Exec с кавычками и экранированием по спецификации"""
+        arg = arg.replace('%', '%%')
+        if arg and not any(char in arg for char in ' \t\n"\'\\><~|&;$*?#()`'):
+            return arg
+        quoted = ''.join('\\' + char if char in '"`$\\' else char for char in arg)
+        # Обратная косая черта экранируется ещё раз на уровне строкового значения
+        quoted = quoted.replace('\\', '\\\\').replace('\n', '\\n').replace('\t', '\\t')
+        return f'"{quoted}"'
+
 class DesktopApp:
     def __init__(self, name: str, exec_cmd: str, icon: str = '', mime_types: List[str] = None, 
                  app_type: str = 'desktop', desktop_file: str = '', app_id: str = '', 
-                 priority: int = 0, usage_count: int = 0):
+                 priority: int = 0, usage_count: int = 0, try_exec: str = '',
+                 no_display: bool = False, generic_name: str = '', keywords: List[str] = None,
+                 exec_template: Optional[List[List[str]]] = None, categories: List[str] = None):
         self.name = name
+        self.generic_name = generic_name
+        self.keywords = keywords or []  # Ключевые слова для поиска (Keywords=)
+        self.categories = categories or []  # Категории из Categories= для правил релевантности
         self.exec_cmd = exec_cmd
+        self._exec_template = exec_template  # Скомпилированный Exec (ExecTemplate), хранится в кэше реестра
+        self.try_exec = try_exec
+        self.no_display = no_display  # Скрыто из меню, но может обрабатывать свои MIME типы
         self.icon = icon
         self.mime_types = mime_types or []
         self.app_type = app_type  # desktop, flatpak, snap, binary
         self.desktop_file = desktop_file
         self.app_id = app_id
-        self.priority = priority  # 0=обычное, 1=рекомендуемое, 2=часто используемое
+        self.priority = priority  # Базовый приоритет: 0=обычное, 1=рекомендуемое, 2=часто используемое
         self.usage_count = usage_count
+        self.frecency = 0.0  # Оценка недавнего и частого использования для текущей цели
         self.last_used = 0
         self.is_available = None  # None=не проверено, True=доступно, False=требует установки
         self.install_command = None  # Команда для установки
+        self.relevance_flags = None  # (RelevanceRules, флаги совпавших правил), вычисляется один раз
 
     def can_open(self, mime_type: str) -> bool:
         if not self.mime_types:
             return True
         # Приводим mime_type к строке на случай, если это объект MIMEtype
         mime_str = str(mime_type)
-        return any(mt in mime_str or mime_str in mt for mt in self.mime_types)
-
-    def is_relevant_for_target(self, target: str, mime_type: str) -> bool:
-        """Проверка релевантности приложения для конкретной цели"""
-        target_lower = target.lower()
-        mime_str = str(mime_type).lower()
-        
-        # URL специфичные фильтры
-        if target.startswith(('http://', 'https://')):
-            # Исключаем явно неподходящие для веб
-            if any(x in self.name.lower() for x in [
-                'gimp', 'inkscape', 'blender', 'audacity', 
-                'libreoffice calc', 'libreoffice impress'
-            ]):
-                return False
-            # Приоритет для браузеров
-            if any(x in self.name.lower() for x in [
-                'firefox', 'chrome', 'chromium', 'browser', 'tor'
-            ]):
-                self.priority = max(self.priority, 1)
-        
-        # Файлы изображений
-        elif mime_str.startswith('image/'):
-            if any(x in self.name.lower() for x in [
-                'gimp', 'image', 'photo', 'viewer', 'paint'
-            ]):
-                self.priority = max(self.priority, 1)
-            # Исключаем текстовые редакторы для изображений
-            if any(x in self.name.lower() for x in [
-                'writer', 'calc', 'impress', 'text editor'
-            ]):
-                return False
-        
-        # Видео файлы
-        elif mime_str.startswith('video/'):
-            if any(x in self.name.lower() for x in [
-                'vlc', 'player', 'video', 'mpv', 'totem'
-            ]):
-                self.priority = max(self.priority, 1)
-            # Исключаем редакторы изображений для видео
-            if any(x in self.name.lower() for x in [
-                'gimp', 'inkscape', 'image viewer'
-            ]):
-                return False
-        
-        # Аудио файлы
-        elif mime_str.startswith('audio/'):
-            if any(x in self.name.lower() for x in [
-                'rhythmbox', 'vlc', 'player', 'audio', 'music'
-            ]):
-                self.priority = max(self.priority, 1)
-        
-        # PDF документы
-        elif 'pdf' in mime_str:
-            if any(x in self.name.lower() for x in [
-                'evince', 'okular', 'reader', 'pdf', 'document viewer'
-            ]):
-                self.priority = max(self.priority, 1)
-        
-        return True
+        return mime_str in self.mime_types or f"{mime_str.split('/')[0]}/*" in self.mime_types
 
-    def check_availability(self) -> bool:
+    def check_availability(self, index: Optional[ExecutableIndex] = None) -> bool:
         """Проверка доступности приложения в системе"""
         if self.is_available is not None:
             return self.is_available
         
-        # Получаем основную команду (первое слово)
-        try:
-            main_cmd = shlex.split(self.exec_cmd)[0]
-        except (ValueError, IndexError):
+        if index is None:
+            index = ExecutableIndex.for_path()
+        
+        # Получаем основную команду (первый аргумент)
+        main_cmd = self.main_command
+        if not main_cmd:
             self.is_available = False
             return False
         
         # Проверяем различные типы приложений
-        if self.app_type == 'flatpak':
-            # Для Flatpak проверяем через flatpak list
-            try:
-                result = subprocess.run(['flatpak', 'info', self.app_id], 
-                                      capture_output=True, timeout=3)
-                self.is_available = result.returncode == 0
-            except Exception:
-                self.is_available = False
-        elif self.app_type == 'snap':
-            # Для Snap проверяем через snap list
-            try:
-                result = subprocess.run(['snap', 'info', self.app_id], 
-                                      capture_output=True, timeout=3)
-                self.is_available = result.returncode == 0
-            except Exception:
-                self.is_available = False
+        if self.app_type == 'flatpak' and self.app_id:
+            # Установленное Flatpak приложение имеет директорию в системной или пользовательской установке
+            self.is_available = any(
+                (base / self.app_id).is_dir() for base in FLATPAK_APP_DIRS
+            )
+        elif self.app_type == 'snap' and self.app_id:
+            # Установленный Snap смонтирован в /snap/<имя>
+            self.is_available = (SNAP_MOUNT_DIR / self.app_id).is_dir()
         else:
             # Для обычных приложений проверяем наличие в PATH или абсолютный путь
-            if os.path.isabs(main_cmd):
-                self.is_available = os.path.isfile(main_cmd) and os.access(main_cmd, os.X_OK)
-            else:
-                try:
-                    result = subprocess.run(['which', main_cmd], 
-                                          capture_output=True, timeout=2)
-                    self.is_available = result.returncode == 0
-                except Exception:
-                    self.is_available = False
+            self.is_available = main_cmd in index
+            # TryExec указывает файл, без которого запись считается неработоспособной
+            if self.is_available and self.try_exec:
+                self.is_available = self.try_exec in index
         
         # Определяем команду установки если приложение недоступно
         if not self.is_available:
@@ -232,38 +831,677 @@ class DesktopApp:
         }
         
         # Получаем основную команду
-        try:
-            main_cmd = shlex.split(self.exec_cmd)[0]
-            return install_commands.get(main_cmd)
-        except (ValueError, IndexError):
-            return None
+        return install_commands.get(self.main_command)
     
+    @property
+    def exec_template(self) -> List[List[str]]:
+        """Шаблон argv, компилируется один раз при обнаружении приложения"""
+        if self._exec_template is None:
+            try:
+                self._exec_template = ExecTemplate.compile(self.exec_cmd)
+            except ValueError as e:
+                logger.debug(f"Некорректный Exec у {self.name}: {e}")
+                self._exec_template = []
+        return self._exec_template
+
+    @property
+    def main_command(self) -> str:
+        """Исполняемый файл команды (первый аргумент Exec без кодов полей)"""
+        template = self.exec_template
+        if template and len(template[0]) == 1:
+            return template[0][0]
+        return ''
+
     def format_exec(self, targets: List[str]) -> List[str]:
-        """Форматирование exec команды с правильной заменой плейсхолдеров"""
-        cmd = self.exec_cmd
+        """Форматирование exec команды с подстановкой кодов полей по спецификации"""
+        return ExecTemplate.expand(self.exec_template, targets, self.name, self.icon, self.desktop_file)
+
+    def accepts_multiple_targets(self) -> bool:
+        """Принимает ли команда список файлов за один запуск (%F/%U или без кодов полей)"""
+        return ExecTemplate.target_mode(self.exec_template) != 'single'
+
+    def build_commands(self, targets: List[str], environ: Optional[Dict[str, str]] = None) -> List[List[str]]:
+        """Команды запуска: процесс на файл для %f/%u, пакеты в пределах ARG_MAX для %F/%U"""
+        if not self.accepts_multiple_targets():
+            return [self.format_exec([target]) for target in targets]
         
-        # Удаляем стандартные плейсхолдеры
-        cmd = cmd.replace('%U', '').replace('%F', '').replace('%u', '').replace('%f', '')
-        cmd = cmd.replace('%i', '').replace('%c', '').replace('%k', '')
+        budget = _argv_budget(environ) - _argv_size(self.format_exec([]))
+        commands = []
+        chunk = []
+        size = 0
+        for target in targets:
+            cost = _argv_size([target])
+            if chunk and size + cost > budget:
+                commands.append(self.format_exec(chunk))
+                chunk = []
+                size = 0
+            chunk.append(target)
+            size += cost
+        if chunk or not commands:
+            commands.append(self.format_exec(chunk))
+        return commands
+
+    @property
+    def usage_key(self) -> str:
+        """Ключ статистики использования: ID .desktop файла или приложения, а не отображаемое имя"""
+        if self.desktop_file:
+            return os.path.basename(self.desktop_file)
+        if self.app_type == 'flatpak' and self.app_id:
+            # Совпадает с ID экспортированного .desktop файла Flatpak
+            return f'{self.app_id}.desktop'
+        if self.app_id:
+            return f'{self.app_type}:{self.app_id}'
+        return self.name
+
+    def to_choice_entry(self) -> Dict[str, Any]:
+        """Данные для запоминания выбора, достаточные для запуска без обнаружения"""
+        return {
+            'name': self.name,
+            'desktop_file': self.desktop_file,
+            'exec_cmd': self.exec_cmd,
+            'app_type': self.app_type,
+            'app_id': self.app_id
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Сериализация записи для кэша реестра"""
+        return {
+            'name': self.name,
+            'exec_cmd': self.exec_cmd,
+            'icon': self.icon,
+            'mime_types': self.mime_types,
+            'app_type': self.app_type,
+            'desktop_file': self.desktop_file,
+            'app_id': self.app_id,
+            'priority': self.priority,
+            'try_exec': self.try_exec,
+            'no_display': self.no_display,
+            'generic_name': self.generic_name,
+            'keywords': self.keywords,
+            'categories': self.categories,
+            'exec_template': self.exec_template
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'DesktopApp':
+        """Восстановление записи из кэша реестра"""
+        return cls(**data)
+
+class RegistryCache:
+    """Дисковый кэш реестра приложений с инвалидацией по mtime источников"""
+
+    def __init__(self, cache_file: Path = REGISTRY_CACHE_FILE, locales: Optional[List[str]] = None):
+        self.cache_file = cache_file
+        # Локализованные имена зависят от локали: при её смене кэш пересобирается
+        self.locales = locales or []
+        self.directories = {}  # путь директории -> {'mtime': ..., 'apps': [...]}
+        self.backends = {}  # имя источника -> {'sources': [...], 'apps': [...]}
+        self.dirty = False
+        self._loaded = False
+        self._used = set()
+        # Источники обнаружения пишут в кэш из рабочих потоков
+        self._lock = threading.RLock()
+
+    def _ensure_loaded(self):
+        """Ленивая загрузка кэша с диска"""
+        if self._loaded:
+            return
+        self._loaded = True
+        self._load()
+
+    @_traced('registry.load')
+    def _load(self):
+        """Чтение и проверка файла кэша"""
+        if not self.cache_file.exists():
+            return
+
+        try:
+            with open(self.cache_file, 'r') as f:
+                data = json.load(f)
+            if (not isinstance(data, dict) or data.get('version') != REGISTRY_CACHE_VERSION
+                    or data.get('locales') != self.locales):
+                logger.info("Версия или локаль кэша реестра не совпадает, выполняется полная пересборка")
+                self.dirty = True
+                return
+            directories = data['directories']
+            backends = data['backends']
+            if not isinstance(directories, dict) or not isinstance(backends, dict):
+                raise ValueError("неверная структура кэша")
+            self.directories = directories
+            self.backends = backends
+        except Exception as e:
+            logger.warning(f"Кэш реестра поврежден, выполняется полная пересборка: {e}")
+            self.directories = {}
+            self.backends = {}
+            self.dirty = True
+
+    @staticmethod
+    def _restore_apps(entry: Dict[str, Any]) -> Optional[List[DesktopApp]]:
+        """Восстановление списка приложений из записи кэша"""
+        try:
+            return [DesktopApp.from_dict(data) for data in entry['apps']]
+        except Exception as e:
+            logger.debug(f"Некорректная запись кэша реестра: {e}")
+            return None
+
+    def get_directory(self, directory: Path, mtime: Optional[int],
+                      allow_stale: bool = False) -> Optional[List[DesktopApp]]:
+        """Приложения директории, если она не менялась с прошлого сканирования
+
+        allow_stale возвращает последние известные результаты без проверки mtime.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            key = str(directory)
+            entry = self.directories.get(key)
+            if not isinstance(entry, dict):
+                return None
+            if not allow_stale and (mtime is None or entry.get('mtime') != mtime):
+                return None
+            apps = self._restore_apps(entry)
+            if apps is not None:
+                self._used.add(('dir', key))
+            return apps
+
+    def put_directory(self, directory: Path, mtime: Optional[int], apps: List[DesktopApp]):
+        """Сохранение результатов сканирования директории"""
+        with self._lock:
+            self._ensure_loaded()
+            key = str(directory)
+            self.directories[key] = {
+                'mtime': mtime,
+                'apps': [app.to_dict() for app in apps]
+            }
+            self._used.add(('dir', key))
+            self.dirty = True
+
+    def get_backend(self, name: str, sources: Optional[List[List[Any]]],
+                    allow_stale: bool = False) -> Optional[List[DesktopApp]]:
+        """Результаты источника, если его исходные пути не менялись
+
+        allow_stale возвращает последние известные результаты без проверки сигнатуры.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            entry = self.backends.get(name)
+            if not isinstance(entry, dict):
+                return None
+            if not allow_stale and entry.get('sources') != sources:
+                return None
+            apps = self._restore_apps(entry)
+            if apps is not None:
+                self._used.add(('backend', name))
+            return apps
+
+    def put_backend(self, name: str, sources: Optional[List[List[Any]]], apps: List[DesktopApp]):
+        """Сохранение результатов источника вместе с его сигнатурой"""
+        entry = {
+            'sources': sources,
+            'apps': [app.to_dict() for app in apps]
+        }
+        with self._lock:
+            self._ensure_loaded()
+            self._used.add(('backend', name))
+            # Неизменившиеся результаты не требуют перезаписи кэша
+            if self.backends.get(name) != entry:
+                self.backends[name] = entry
+                self.dirty = True
+
+    def clear(self):
+        """Сброс кэша: все источники будут просканированы заново"""
+        with self._lock:
+            self._loaded = True
+            self.directories = {}
+            self.backends = {}
+            self.dirty = True
+
+    @_traced('registry.save')
+    def save(self):
+        """Атомарная запись кэша на диск (только при изменениях)"""
+        with self._lock:
+            if not self.dirty:
+                return
+
+            # Удаляем записи о директориях и источниках, которые больше не сканируются
+            self.directories = {k: v for k, v in self.directories.items() if ('dir', k) in self._used}
+            self.backends = {k: v for k, v in self.backends.items() if ('backend', k) in self._used}
+
+            data = {
+                'version': REGISTRY_CACHE_VERSION,
+                'locales': self.locales,
+                'directories': self.directories,
+                'backends': self.backends
+            }
+            try:
+                self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(dir=str(self.cache_file.parent), prefix='.registry-')
+                try:
+                    with os.fdopen(fd, 'w') as f:
+                        json.dump(data, f, separators=(',', ':'))
+                    os.replace(tmp_path, self.cache_file)
+                except Exception:
+                    os.unlink(tmp_path)
+                    raise
+                self.dirty = False
+            except Exception as e:
+                logger.error(f"Ошибка сохранения кэша реестра: {e}")
+
+class MimeIndex:
+    """Инвертированный индекс: MIME тип -> имена приложений, которые его открывают"""
+
+    def __init__(self):
+        self.by_mime = {}  # MIME тип -> множество имён приложений
+        self.generic = set()  # Приложения без объявленных MIME типов открывают всё
+
+    def add(self, app_name: str, mime_types: List[str]):
+        """Добавление приложения в индекс"""
+        if not mime_types:
+            self.generic.add(app_name)
+            return
+        for mime_type in mime_types:
+            self.by_mime.setdefault(mime_type, set()).add(app_name)
+
+    def lookup(self, mime_type: str) -> Set[str]:
+        """Имена приложений для MIME типа (точное совпадение, major/* и общие)"""
+        mime_str = str(mime_type)
+        result = set(self.generic)
+        result.update(self.by_mime.get(mime_str, ()))
+        result.update(self.by_mime.get(f"{mime_str.split('/')[0]}/*", ()))
+        return result
+
+    @classmethod
+    @_traced('mime_index.build')
+    def build(cls, apps: Dict[str, DesktopApp], desktop_dirs: List[Path]) -> 'MimeIndex':
+        """Построение индекса из mimeinfo.cache и разобранных ключей MimeType="""
+        index = cls()
+        path_to_name = {app.desktop_file: name for name, app in apps.items() if app.desktop_file}
+        
+        # Актуальные mimeinfo.cache (сгенерированные update-desktop-database).
+        # mtime директории не годится: запись самого кэша через переименование
+        # временного файла сдвигает его позже mtime кэша
+        indexed = set()
+        for desktop_dir in desktop_dirs:
+            cache_file = desktop_dir / 'mimeinfo.cache'
+            cache_mtime = _path_mtime(cache_file)
+            newest_mtime = cls._newest_desktop_mtime(desktop_dir)
+            if cache_mtime is None or newest_mtime is None or cache_mtime < newest_mtime:
+                continue
+            try:
+                associations = cls._read_mimeinfo_cache(cache_file)
+            except Exception as e:
+                logger.debug(f"Ошибка чтения {cache_file}: {e}")
+                continue
+            
+            dir_prefix = str(desktop_dir) + os.sep
+            dir_names = {path: name for path, name in path_to_name.items()
+                         if path.startswith(dir_prefix)}
+            declared = set()
+            for mime_type, desktop_ids in associations.items():
+                for desktop_id in desktop_ids:
+                    name = dir_names.get(dir_prefix + desktop_id)
+                    if name:
+                        index.by_mime.setdefault(mime_type, set()).add(name)
+                        declared.add(name)
+            for name in dir_names.values():
+                if name not in declared:
+                    # Файл мог появиться после генерации кэша с сохранённым mtime
+                    # (установка пакета): используем его собственный MimeType=
+                    index.add(name, apps[name].mime_types)
+            indexed.update(dir_names)
         
-        # Разбиваем команду и добавляем цели
-        parts = shlex.split(cmd)
-        return parts + targets
+        # Остальные приложения индексируются по собственным MIME типам
+        for name, app in apps.items():
+            if not app.desktop_file or app.desktop_file not in indexed:
+                index.add(name, app.mime_types)
+        return index
+
+    @staticmethod
+    def _newest_desktop_mtime(desktop_dir: Path) -> Optional[int]:
+        """Наибольший mtime .desktop файлов директории (0 для пустой) или None, если она недоступна"""
+        newest = 0
+        try:
+            with os.scandir(desktop_dir) as entries:
+                for entry in entries:
+                    if entry.name.endswith('.desktop'):
+                        try:
+                            newest = max(newest, entry.stat().st_mtime_ns)
+                        except OSError:
+                            continue
+        except OSError:
+            return None
+        return newest
+
+    @staticmethod
+    def _read_mimeinfo_cache(cache_file: Path) -> Dict[str, List[str]]:
+        """Разбор секции [MIME Cache] файла mimeinfo.cache"""
+        associations = {}
+        in_section = False
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith('['):
+                    in_section = line == '[MIME Cache]'
+                    continue
+                if not in_section or '=' not in line or line.startswith('#'):
+                    continue
+                mime_type, desktop_ids = line.split('=', 1)
+                associations[mime_type.strip()] = [d for d in desktop_ids.split(';') if d]
+        return associations
+
+class SearchIndex:
+    """Индекс нечёткого поиска по токенам и триграммам полей приложений
+
+    Синхронизируется с реестром в фоновом потоке, а запросы выполняются в главном,
+    поэтому изменения и поиск идут под блокировкой.
+    """
+    TOKEN_SPLIT = re.compile(r'[\W_]+')
+    MIN_SIMILARITY = 0.5  # Доля общих триграмм для нечёткого совпадения
+    # Уровни совпадения: чем меньше, тем выше в результатах
+    NAME_PREFIX, TOKEN_PREFIX, SUBSTRING, FUZZY = range(4)
 
-class AppDiscovery:
     def __init__(self):
+        self.names = {}  # имя -> имя в нижнем регистре
+        self.fields = {}  # имя -> проиндексированные поля (для синхронизации с реестром)
+        self.tokens = {}  # имя -> токены всех полей
+        # Префиксы и триграммы индексируют уникальные токены: слова вроде
+        # "editor" или "gnome" повторяются у многих приложений
+        self.token_names = {}  # токен -> имена
+        self.prefixes = {}  # первые 1-2 символа -> токены
+        self.trigrams = {}  # триграмма -> токены
+        self._lock = threading.RLock()
+        self._sync_lock = threading.Lock()  # одна синхронизация с реестром за раз
+
+    @classmethod
+    def tokenize(cls, text: str) -> List[str]:
+        """Разбиение текста на токены в нижнем регистре"""
+        return [token for token in cls.TOKEN_SPLIT.split(text.lower()) if token]
+
+    @staticmethod
+    def _trigrams(token: str) -> Set[str]:
+        return {token[i:i + 3] for i in range(len(token) - 2)}
+
+    @staticmethod
+    def _fields(app: DesktopApp) -> Tuple[str, ...]:
+        """Поля поиска: название, GenericName, Keywords, ID приложения и имя исполняемого файла"""
+        fields = [app.name, app.generic_name, app.app_id]
+        fields.extend(app.keywords)
+        if app.desktop_file:
+            fields.append(Path(app.desktop_file).stem)
+        command = app.exec_cmd.split(None, 1)
+        if command:
+            fields.append(os.path.basename(command[0].strip('"\'')))
+        return tuple(fields)
+
+    def add(self, app: DesktopApp, fields: Optional[Tuple[str, ...]] = None):
+        """Добавление (или замена) приложения в индексе"""
+        if fields is None:
+            fields = self._fields(app)
+        tokens = tuple(dict.fromkeys(
+            token for field in fields for token in self.tokenize(field)
+        ))
+        with self._lock:
+            self.remove(app.name)
+            self.names[app.name] = app.name.lower()
+            self.fields[app.name] = fields
+            self.tokens[app.name] = tokens
+            
+            for token in tokens:
+                names = self.token_names.get(token)
+                if names is None:
+                    names = self.token_names[token] = set()
+                    for prefix in {token[:1], token[:2]}:
+                        self.prefixes.setdefault(prefix, set()).add(token)
+                    for trigram in self._trigrams(token):
+                        self.trigrams.setdefault(trigram, set()).add(token)
+                names.add(app.name)
+
+    def remove(self, app_name: str):
+        """Удаление приложения из индекса"""
+        with self._lock:
+            tokens = self.tokens.pop(app_name, None)
+            if tokens is None:
+                return
+            del self.names[app_name]
+            del self.fields[app_name]
+            
+            for token in tokens:
+                names = self.token_names[token]
+                names.discard(app_name)
+                if names:
+                    continue
+                del self.token_names[token]
+                for prefix in {token[:1], token[:2]}:
+                    self.prefixes[prefix].discard(token)
+                for trigram in self._trigrams(token):
+                    self.trigrams[trigram].discard(token)
+
+    def sync(self, apps: Dict[str, DesktopApp]):
+        """Приведение индекса к реестру: переиндексируются только приложения с изменившимися полями"""
+        with self._sync_lock:
+            with self._lock:
+                gone = [name for name in self.tokens if name not in apps]
+            for name in gone:
+                self.remove(name)
+            for name, app in apps.items():
+                fields = self._fields(app)
+                if self.fields.get(name) != fields:
+                    self.add(app, fields)
+
+    @classmethod
+    def build(cls, apps: Dict[str, DesktopApp]) -> 'SearchIndex':
+        """Построение индекса по всем приложениям реестра"""
+        index = cls()
+        for app in apps.values():
+            index.add(app)
+        return index
+
+    def search(self, query: str) -> Dict[str, Tuple[int, float]]:
+        """Приложения, подходящие под все слова запроса: имя -> (уровень совпадения, сходство)"""
+        with self._lock:
+            return self._search(query)
+
+    def _search(self, query: str) -> Dict[str, Tuple[int, float]]:
+        results = None
+        for term in self.tokenize(query):
+            matches = self._match_term(term)
+            if results is not None:
+                # Итог по приложению определяется худшим из совпадений слов
+                matches = {
+                    name: (max(level, results[name][0]), min(similarity, results[name][1]))
+                    for name, (level, similarity) in matches.items() if name in results
+                }
+            results = matches
+            if not results:
+                return {}
+        if results is None:
+            return {}
+        
+        query_lower = query.strip().lower()
+        for name in results:
+            if self.names[name].startswith(query_lower):
+                results[name] = (self.NAME_PREFIX, 1.0)
+        return results
+
+    def _match_term(self, term: str) -> Dict[str, Tuple[int, float]]:
+        """Совпадения одного слова запроса; для приложения берётся лучший из его токенов"""
+        if len(term) < 3:
+            # Короткие слова ищутся только как начало токена
+            tokens = {token: (self.TOKEN_PREFIX, 1.0) for token in self.prefixes.get(term, ())}
+        else:
+            term_trigrams = self._trigrams(term)
+            counts = {}
+            for trigram in term_trigrams:
+                for token in self.trigrams.get(trigram, ()):
+                    counts[token] = counts.get(token, 0) + 1
+            
+            tokens = {}
+            needed = len(term_trigrams) * self.MIN_SIMILARITY
+            for token, count in counts.items():
+                if count < needed:
+                    continue
+                if token.startswith(term):
+                    tokens[token] = (self.TOKEN_PREFIX, 1.0)
+                elif term in token:
+                    tokens[token] = (self.SUBSTRING, 1.0)
+                else:
+                    tokens[token] = (self.FUZZY, count / len(term_trigrams))
+        
+        matches = {}
+        for token, (level, similarity) in tokens.items():
+            for name in self.token_names[token]:
+                best = matches.get(name)
+                if best is None or (level, -similarity) < (best[0], -best[1]):
+                    matches[name] = (level, similarity)
+        return matches
+
+class TorBrowserLocator:
+    """Поиск Tor Browser ограниченным обходом директорий с постоянным кэшем находок"""
+
+    def __init__(self, cache_file: Path = TOR_LOCATIONS_FILE, ttl: float = TOR_SCAN_TTL):
+        self.cache_file = cache_file
+        self.ttl = ttl
+
+    def cached_paths(self) -> List[str]:
+        """Существующие пути из кэша находок без учёта срока давности"""
+        cached = self._load()
+        if cached is None:
+            return []
+        return [path for path in cached['paths'] if self._is_executable(path)]
+
+    def locate(self, rescan: bool = False) -> List[str]:
+        """Пути к start-tor-browser: из кэша (с проверкой stat) или после сканирования"""
+        if not rescan:
+            cached = self._load()
+            if cached is not None and time.time() - cached['scanned_at'] < self.ttl:
+                return [path for path in cached['paths'] if self._is_executable(path)]
+        
+        paths = self._scan()
+        self._save(paths)
+        return paths
+
+    @staticmethod
+    def _is_executable(path: str) -> bool:
+        """Проверка, что найденный ранее файл всё ещё существует и исполняем"""
+        try:
+            return stat.S_ISREG(os.stat(path).st_mode) and os.access(path, os.X_OK)
+        except OSError:
+            return False
+
+    def _load(self) -> Optional[Dict[str, Any]]:
+        """Загрузка кэша находок"""
+        try:
+            with open(self.cache_file, 'r') as f:
+                data = json.load(f)
+            if isinstance(data.get('scanned_at'), (int, float)) and isinstance(data.get('paths'), list):
+                return data
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.debug(f"Кэш Tor Browser поврежден: {e}")
+        return None
+
+    def _save(self, paths: List[str]):
+        """Сохранение находок вместе со временем сканирования"""
+        try:
+            self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+            # Уникальный временный файл: параллельные сканирования не смешивают запись
+            fd, tmp_path = tempfile.mkstemp(dir=str(self.cache_file.parent), prefix='.tor-browser-')
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    json.dump({'scanned_at': int(time.time()), 'paths': paths}, f)
+                os.replace(tmp_path, self.cache_file)
+            except Exception:
+                os.unlink(tmp_path)
+                raise
+        except Exception as e:
+            logger.debug(f"Ошибка сохранения кэша Tor Browser: {e}")
+
+    @staticmethod
+    def _network_mounts() -> set:
+        """Точки монтирования сетевых файловых систем"""
+        mounts = set()
+        try:
+            with open('/proc/self/mounts', 'r') as f:
+                for line in f:
+                    fields = line.split()
+                    if len(fields) >= 3 and fields[2] in NETWORK_FS_TYPES:
+                        # Пробелы в путях экранированы как \040
+                        mounts.add(fields[1].replace('\\040', ' '))
+        except OSError:
+            pass
+        return mounts
+
+    @_traced('tor.scan')
+    def _scan(self) -> List[str]:
+        """Обход корней поиска с ограничением глубины"""
+        excluded_mounts = self._network_mounts()
+        found = []
+        
+        for root, max_depth in TOR_SCAN_ROOTS:
+            stack = [(str(root), 0)]
+            while stack:
+                directory, depth = stack.pop()
+                try:
+                    with os.scandir(directory) as it:
+                        entries = list(it)
+                except OSError:
+                    continue
+                
+                for entry in entries:
+                    try:
+                        if entry.name == 'start-tor-browser':
+                            if entry.is_file() and os.access(entry.path, os.X_OK) and entry.path not in found:
+                                found.append(entry.path)
+                            continue
+                        if (depth + 1 >= max_depth
+                                or entry.name.startswith('.')
+                                or entry.name in TOR_SCAN_EXCLUDED_DIRS
+                                or entry.path in excluded_mounts
+                                or not entry.is_dir(follow_symlinks=False)):
+                            continue
+                        stack.append((entry.path, depth + 1))
+                    except OSError:
+                        continue
+        
+        logger.debug(f"Сканирование Tor Browser: найдено {len(found)}")
+        return found
+
+class AppDiscovery:
+    # Порядок приоритета источников: при совпадении имён побеждает более ранний
+    BACKEND_ORDER = ('desktop', 'flatpak', 'snap', 'browsers', 'tor')
+    
+    def __init__(self, cache: Optional[RegistryCache] = None, timeout: float = DISCOVERY_TIMEOUT):
         self.apps = {}
+        self.cache = cache if cache is not None else RegistryCache(locales=_desktop_locales())
+        self.timeout = timeout
+        self.executables = None
+        self.tor_locator = TorBrowserLocator()
+        self.desktop_parser = DesktopEntryParser()
+        self.mime_index = MimeIndex()
+        # Индекс поиска переживает загрузки реестра: в резидентном режиме
+        # переиндексируются только изменившиеся приложения
+        self.search_index = SearchIndex()
+        self.rescan = False  # Игнорировать кэши и пересканировать все источники
+        self._origins = {}  # имя приложения -> источник, из которого оно взято
+        self._lock = threading.Lock()
+        # Проход обнаружения (растёт при _reset) и число незавершённых discover_async:
+        # новый проход ждёт слияния фоновых результатов предыдущего
+        self._generation = 0
+        self._in_flight = 0
+        self._idle = threading.Condition(self._lock)
         
     def discover_all(self) -> Dict[str, DesktopApp]:
         """Полное обнаружение всех приложений"""
-        self.apps = {}
+        self._reset()
+        
+        with _span('discovery.backends'):
+            results = self._run_backends(self._backends())
+        for backend_name in self.BACKEND_ORDER:
+            self._merge_backend(backend_name, results[backend_name])
         
-        # Основные методы обнаружения
-        self._discover_desktop_files()
-        self._discover_flatpak_apps()
-        self._discover_snap_apps()
-        self._discover_common_browsers()
-        self._discover_tor_browser()  # Специальное обнаружение Tor
+        self.cache.save()
+        
+        self.mime_index = MimeIndex.build(self.apps, self._desktop_dirs())
         
         # Проверяем доступность всех найденных приложений
         self._check_apps_availability()
@@ -271,21 +1509,303 @@ class AppDiscovery:
         logger.info(f"Обнаружено {len(self.apps)} приложений")
         return self.apps
     
+    def discover_cached(self) -> Dict[str, DesktopApp]:
+        """Быстрый набор для немедленного показа: .desktop файлы и прошлые результаты остальных источников
+
+        Доступность приложений не проверяется; актуальные данные приходят из discover_async.
+        """
+        self._reset()
+        
+        with _span('discovery.cached'):
+            self._merge_backend('desktop', self._discover_desktop_files())
+        for backend_name in self.BACKEND_ORDER[1:]:
+            self._merge_backend(backend_name, self._stale_results(backend_name))
+        
+        self.mime_index = MimeIndex.build(self.apps, self._desktop_dirs())
+        return self.apps
+    
+    def discover_async(self, on_update: Callable[[List[DesktopApp], List[str]], None]):
+        """Фоновое обнаружение всеми источниками
+
+        on_update(изменённые, удалённые имена) вызывается из рабочих потоков
+        по мере готовности каждого источника; приложения приходят уже с
+        проверенной доступностью.
+        """
+        index = self.executables or ExecutableIndex.for_path()
+        backends = self._backends()
+        remaining = [len(backends)]
+        with self._lock:
+            generation = self._generation
+            self._in_flight += 1
+        
+        def on_backend_done(backend_name: str, future: concurrent.futures.Future):
+            try:
+                apps = future.result()
+            except Exception as e:
+                logger.error(f"Ошибка источника {backend_name}: {e}")
+                apps = self._stale_results(backend_name)
+            
+            with _span('availability', backend=backend_name, apps=len(apps)):
+                for app in apps:
+                    app.check_availability(index)
+            changed, removed = self._merge_backend(backend_name, apps, generation)
+            
+            with self._lock:
+                remaining[0] -= 1
+                finished = remaining[0] == 0
+                current = generation == self._generation
+                snapshot = dict(self.apps) if finished and current else None
+            if finished:
+                try:
+                    self.cache.save()
+                    if snapshot is not None:
+                        mime_index = MimeIndex.build(snapshot, self._desktop_dirs())
+                        with self._lock:
+                            if generation == self._generation:
+                                self.mime_index = mime_index
+                        logger.info(f"Обнаружено {len(snapshot)} приложений")
+                finally:
+                    with self._lock:
+                        self._in_flight -= 1
+                        self._idle.notify_all()
+            
+            if changed or removed:
+                on_update(changed, removed)
+        
+        for backend_name, discover, sources in backends:
+            future = self._start_backend(backend_name, discover, sources)
+            future.add_done_callback(functools.partial(on_backend_done, backend_name))
+    
+    def search_index_async(self, apps: Dict[str, DesktopApp]) -> concurrent.futures.Future:
+        """Синхронизация индекса поиска с загруженным реестром в фоновом потоке
+
+        Результат Future — сам индекс; до его готовности поиск не выполняется.
+        """
+        future = concurrent.futures.Future()
+        snapshot = dict(apps)
+        
+        def sync():
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                with _span('search_index.sync', apps=len(snapshot)):
+                    self.search_index.sync(snapshot)
+                future.set_result(self.search_index)
+            except Exception as e:
+                future.set_exception(e)
+        
+        threading.Thread(target=sync, name='search-index', daemon=True).start()
+        return future
+    
+    def snapshot(self) -> Dict[str, DesktopApp]:
+        """Копия реестра; фоновые источники discover_async меняют его под блокировкой"""
+        with self._lock:
+            return dict(self.apps)
+    
+    def _reset(self):
+        """Подготовка к новому проходу обнаружения"""
+        with self._lock:
+            # Результаты предыдущего discover_async сливаются в реестр, который
+            # сейчас будет заменён; зависший источник ждём не дольше таймаута
+            if not self._idle.wait_for(lambda: self._in_flight == 0, timeout=self.timeout):
+                logger.debug("Фоновое обнаружение не завершилось, его результаты будут отброшены")
+            self._generation += 1
+            self.apps = {}
+            self._origins = {}
+        
+        if self.rescan:
+            self.cache.clear()
+        
+        # Один индекс PATH на запуск; в резидентном режиме перестраивается при изменениях
+        self.executables = ExecutableIndex.for_path(revalidate=True)
+    
+    def _backends(self) -> List[Tuple[str, Callable[[], List[DesktopApp]], Optional[List[str]]]]:
+        """Источники обнаружения в порядке BACKEND_ORDER с путями для проверки кэша"""
+        sources = self._backend_sources()
+        return [
+            ('desktop', self._discover_desktop_files, None),
+            ('flatpak', self._discover_flatpak_apps, sources['flatpak']),
+            ('snap', self._discover_snap_apps, sources['snap']),
+            ('browsers', self._discover_common_browsers, sources['browsers']),
+            # Tor Browser кэшируется собственным локатором
+            ('tor', self._discover_tor_browser, None)
+        ]
+    
+    def _merge_backend(self, backend_name: str, apps: List[DesktopApp],
+                       generation: Optional[int] = None) -> Tuple[List[DesktopApp], List[str]]:
+        """Слияние результатов источника с учётом приоритета; возвращает изменённые и удалённые
+
+        generation — проход discover_async: результаты прохода, реестр которого
+        уже заменён новым, отбрасываются.
+        """
+        rank = self.BACKEND_ORDER.index(backend_name)
+        changed = []
+        removed = []
+        new_names = set()
+        
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return changed, removed
+            for app in apps:
+                new_names.add(app.name)
+                origin = self._origins.get(app.name)
+                # Внутри источника более поздняя запись переопределяет раннюю
+                # (так .desktop файлы пользователя перекрывают системные)
+                if origin is None or self.BACKEND_ORDER.index(origin) >= rank:
+                    self.apps[app.name] = app
+                    self._origins[app.name] = backend_name
+                    changed.append(app)
+            
+            # Приложения, пропавшие из свежих результатов источника
+            for name, origin in list(self._origins.items()):
+                if origin == backend_name and name not in new_names:
+                    del self._origins[name]
+                    del self.apps[name]
+                    removed.append(name)
+        
+        return changed, removed
+    
+    def _run_backends(self, backends: List[Tuple[str, Callable[[], List[DesktopApp]], Optional[List[str]]]]
+                      ) -> Dict[str, List[DesktopApp]]:
+        """Параллельный запуск источников с общим ограничением времени"""
+        futures = {}
+        for backend_name, discover, sources in backends:
+            futures[backend_name] = self._start_backend(backend_name, discover, sources)
+        
+        concurrent.futures.wait(futures.values(), timeout=self.timeout)
+        
+        results = {}
+        timed_out = []
+        for backend_name, future in futures.items():
+            if future.done():
+                try:
+                    results[backend_name] = future.result()
+                    continue
+                except Exception as e:
+                    logger.error(f"Ошибка источника {backend_name}: {e}")
+            else:
+                timed_out.append(backend_name)
+                # Результаты опоздавшего источника попадут в кэш для следующего запуска
+                future.add_done_callback(lambda f: self.cache.save())
+            results[backend_name] = self._stale_results(backend_name)
+        
+        if timed_out:
+            logger.warning(
+                f"Источники не уложились в {self.timeout} с, использованы прошлые результаты: "
+                f"{', '.join(timed_out)}"
+            )
+        return results
+    
+    def _start_backend(self, backend_name: str, discover: Callable[[], List[DesktopApp]],
+                       sources: Optional[List[str]]) -> concurrent.futures.Future:
+        """Запуск источника в отдельном потоке"""
+        future = concurrent.futures.Future()
+        # Потоки-демоны: зависший источник не задерживает завершение процесса
+        thread = threading.Thread(
+            target=self._run_backend,
+            args=(future, backend_name, sources, discover),
+            name=f'discovery-{backend_name}',
+            daemon=True
+        )
+        thread.start()
+        return future
+    
+    def _run_backend(self, future: concurrent.futures.Future, backend_name: str,
+                     sources: Optional[List[str]], discover):
+        """Запуск источника приложений с использованием кэша реестра"""
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            with _span(f'discovery.{backend_name}') as span:
+                if sources is None:
+                    # Источник сам управляет кэшем (например, по директориям)
+                    apps = discover()
+                    if backend_name != 'desktop':
+                        # Последние результаты для подстановки, если источник не уложится во время
+                        self.cache.put_backend(backend_name, None, apps)
+                else:
+                    signature = [[path, _path_mtime(path)] for path in sources]
+                    apps = self.cache.get_backend(backend_name, signature)
+                    if apps is None:
+                        apps = discover()
+                        self.cache.put_backend(backend_name, signature, apps)
+                    elif span is not _NULL_SPAN:
+                        span.args['cached'] = True
+            future.set_result(apps)
+        except Exception as e:
+            future.set_exception(e)
+    
+    def _stale_results(self, backend_name: str) -> List[DesktopApp]:
+        """Последние известные результаты источника без проверки актуальности"""
+        if backend_name == 'desktop':
+            apps = []
+            for desktop_dir in self._desktop_dirs():
+                apps.extend(self.cache.get_directory(desktop_dir, None, allow_stale=True) or [])
+            return apps
+        apps = self.cache.get_backend(backend_name, None, allow_stale=True)
+        if apps is None and backend_name == 'tor':
+            # В кэше реестра Tor Browser ещё нет: берём находки из кэша локатора
+            apps = self._tor_apps(self.tor_locator.cached_paths())
+        return apps or []
+    
+    def _backend_sources(self) -> Dict[str, List[str]]:
+        """Пути, изменение которых делает результаты источника устаревшими"""
+        path_dirs = [d for d in os.environ.get('PATH', '').split(os.pathsep) if d]
+        return {
+            'flatpak': [str(d) for d in FLATPAK_APP_DIRS],
+            'snap': [
+                str(SNAP_MOUNT_DIR),
+                '/var/lib/snapd/snaps'
+            ],
+            'browsers': path_dirs
+        }
+    
+    def resolve_entry(self, entry: Dict[str, Any]) -> Optional[DesktopApp]:
+        """Восстановление запомненного приложения без полного обнаружения"""
+        desktop_file = entry.get('desktop_file')
+        exec_cmd = entry.get('exec_cmd')
+        
+        if desktop_file:
+            # Перечитываем только один .desktop файл: Exec мог измениться после обновления
+            if not os.path.isfile(desktop_file):
+                return None
+            try:
+                app = self._parse_desktop_file(Path(desktop_file))
+            except Exception as e:
+                logger.debug(f"Ошибка парсинга {desktop_file}: {e}")
+                return None
+        elif exec_cmd:
+            app = DesktopApp(
+                name=entry.get('name', ''),
+                exec_cmd=exec_cmd,
+                app_type=entry.get('app_type', 'desktop'),
+                app_id=entry.get('app_id', '')
+            )
+        else:
+            # Запись старого формата содержит только имя
+            return None
+        
+        if not app or not app.check_availability():
+            return None
+        return app
+    
     def _check_apps_availability(self):
         """Проверка доступности всех приложений"""
         available_count = 0
         unavailable_count = 0
         
-        for app in self.apps.values():
-            if app.check_availability():
-                available_count += 1
-            else:
-                unavailable_count += 1
+        index = self.executables or ExecutableIndex.for_path()
+        with _span('availability', apps=len(self.apps)):
+            for app in self.apps.values():
+                if app.check_availability(index):
+                    available_count += 1
+                else:
+                    unavailable_count += 1
         
         logger.info(f"Доступно: {available_count}, Требует установки: {unavailable_count}")
     
-    def _discover_desktop_files(self):
-        """Обнаружение через .desktop файлы"""
+    def _desktop_dirs(self) -> List[Path]:
+        """Директории с .desktop файлами в порядке сканирования"""
         desktop_dirs = []
         
         if HAS_XDG:
@@ -300,75 +1820,77 @@ class AppDiscovery:
             Path.home() / '.local/share/flatpak/exports/share/applications'
         ])
         
-        for desktop_dir in desktop_dirs:
-            if not desktop_dir.exists():
+        # Повторное сканирование директории даёт тот же результат, что и последнее
+        unique_dirs = []
+        for desktop_dir in reversed(desktop_dirs):
+            if desktop_dir not in unique_dirs:
+                unique_dirs.append(desktop_dir)
+        unique_dirs.reverse()
+        return unique_dirs
+    
+    def _discover_desktop_files(self) -> List[DesktopApp]:
+        """Обнаружение через .desktop файлы"""
+        apps = []
+        
+        for desktop_dir in self._desktop_dirs():
+            # mtime фиксируется до сканирования: изменения во время разбора
+            # приведут к повторному сканированию при следующем запуске
+            mtime = _path_mtime(desktop_dir)
+            if mtime is None:
                 continue
-                
+            
+            cached = self.cache.get_directory(desktop_dir, mtime)
+            if cached is not None:
+                apps.extend(cached)
+                continue
+            
+            dir_apps = []
             for desktop_file in desktop_dir.glob('*.desktop'):
                 try:
-                    self._parse_desktop_file(desktop_file)
+                    app = self._parse_desktop_file(desktop_file)
+                    if app:
+                        dir_apps.append(app)
                 except Exception as e:
                     logger.debug(f"Ошибка парсинга {desktop_file}: {e}")
+            
+            self.cache.put_directory(desktop_dir, mtime, dir_apps)
+            apps.extend(dir_apps)
+        
+        return apps
     
-    def _parse_desktop_file(self, desktop_file: Path):
+    def _parse_desktop_file(self, desktop_file: Path) -> Optional[DesktopApp]:
         """Парсинг .desktop файла"""
-        if HAS_XDG:
-            try:
-                entry = DesktopEntry(str(desktop_file))
-                name = entry.getName()
-                exec_cmd = entry.getExec()
-                icon = entry.getIcon()
-                mime_types = entry.getMimeTypes()
-                
-                if exec_cmd and name and not entry.getHidden():
-                    app_type = 'flatpak' if 'flatpak' in str(desktop_file) else 'desktop'
-                    self.apps[name] = DesktopApp(
-                        name=name,
-                        exec_cmd=exec_cmd,
-                        icon=icon,
-                        mime_types=mime_types,
-                        app_type=app_type,
-                        desktop_file=str(desktop_file)
-                    )
-            except Exception:
-                # Fallback парсинг
-                self._parse_desktop_file_manual(desktop_file)
-        else:
-            self._parse_desktop_file_manual(desktop_file)
-    
-    def _parse_desktop_file_manual(self, desktop_file: Path):
-        """Ручной парсинг .desktop файла"""
-        try:
-            with open(desktop_file, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            entry_data = {}
-            for line in content.split('\n'):
-                if '=' in line and not line.startswith('#'):
-                    key, value = line.split('=', 1)
-                    entry_data[key.strip()] = value.strip()
-            
-            name = entry_data.get('Name', '')
-            exec_cmd = entry_data.get('Exec', '')
-            icon = entry_data.get('Icon', '')
-            mime_types = entry_data.get('MimeType', '').split(';')
-            mime_types = [mt.strip() for mt in mime_types if mt.strip()]
-            
-            if exec_cmd and name and entry_data.get('Hidden', '').lower() != 'true':
-                app_type = 'flatpak' if 'flatpak' in str(desktop_file) else 'desktop'
-                self.apps[name] = DesktopApp(
-                    name=name,
-                    exec_cmd=exec_cmd,
-                    icon=icon,
-                    mime_types=mime_types,
-                    app_type=app_type,
-                    desktop_file=str(desktop_file)
-                )
-        except Exception as e:
-            logger.debug(f"Ошибка ручного парсинга {desktop_file}: {e}")
+        entry = self.desktop_parser.parse(desktop_file)
+        if not entry:
+            return None
+        
+        name = entry.get('Name', '')
+        exec_cmd = entry.get('Exec', '')
+        if not exec_cmd or not name:
+            return None
+        if entry.get('Type', 'Application') != 'Application':
+            return None
+        if entry.get('Hidden', '').lower() == 'true':
+            return None
+        
+        app_type = 'flatpak' if 'flatpak' in str(desktop_file) else 'desktop'
+        return DesktopApp(
+            name=name,
+            exec_cmd=exec_cmd,
+            icon=entry.get('Icon', ''),
+            mime_types=DesktopEntryParser.split_list(entry.get('MimeType', '')),
+            app_type=app_type,
+            desktop_file=str(desktop_file),
+            try_exec=entry.get('TryExec', ''),
+            no_display=entry.get('NoDisplay', '').lower() == 'true',
+            generic_name=entry.get('GenericName', ''),
+            keywords=DesktopEntryParser.split_list(entry.get('Keywords', '')),
+            categories=DesktopEntryParser.split_list(entry.get('Categories', ''))
+        )
     
-    def _discover_flatpak_apps(self):
+    def _discover_flatpak_apps(self) -> List[DesktopApp]:
         """Обнаружение Flatpak приложений"""
+        apps = []
         try:
             result = subprocess.run(['flatpak', 'list', '--app'], 
                                   capture_output=True, text=True, timeout=5)
@@ -381,18 +1903,19 @@ class AppDiscovery:
                             app_id = parts[1]
                             exec_cmd = f"flatpak run {app_id}"
                             
-                            if name not in self.apps:
-                                self.apps[name] = DesktopApp(
-                                    name=name,
-                                    exec_cmd=exec_cmd,
-                                    app_type='flatpak',
-                                    app_id=app_id
-                                )
+                            apps.append(DesktopApp(
+                                name=name,
+                                exec_cmd=exec_cmd,
+                                app_type='flatpak',
+                                app_id=app_id
+                            ))
         except Exception as e:
             logger.debug(f"Ошибка обнаружения Flatpak: {e}")
+        return apps
     
-    def _discover_snap_apps(self):
+    def _discover_snap_apps(self) -> List[DesktopApp]:
         """Обнаружение Snap приложений"""
+        apps = []
         try:
             result = subprocess.run(['snap', 'list'], 
                                   capture_output=True, text=True, timeout=5)
@@ -405,17 +1928,17 @@ class AppDiscovery:
                             name = parts[0]
                             exec_cmd = f"snap run {name}"
                             
-                            if name not in self.apps:
-                                self.apps[name] = DesktopApp(
-                                    name=name.title(),
-                                    exec_cmd=exec_cmd,
-                                    app_type='snap',
-                                    app_id=name
-                                )
+                            apps.append(DesktopApp(
+                                name=name.title(),
+                                exec_cmd=exec_cmd,
+                                app_type='snap',
+                                app_id=name
+                            ))
         except Exception as e:
             logger.debug(f"Ошибка обнаружения Snap: {e}")
+        return apps
     
-    def _discover_common_browsers(self):
+    def _discover_common_browsers(self) -> List[DesktopApp]:
         """Обнаружение популярных браузеров"""
         common_browsers = [
             ('Firefox', 'firefox'),
@@ -428,17 +1951,22 @@ class AppDiscovery:
             ('Vivaldi', 'vivaldi')
         ]
         
+        apps = []
+        found_names = set()
         for name, cmd in common_browsers:
-            if self._command_exists(cmd) and name not in self.apps:
-                self.apps[name] = DesktopApp(
+            if name not in found_names and self._command_exists(cmd):
+                found_names.add(name)
+                apps.append(DesktopApp(
                     name=name,
                     exec_cmd=cmd,
                     mime_types=['text/html', 'application/xhtml+xml'],
                     app_type='browser',
+                    categories=['Network', 'WebBrowser'],
                     priority=1  # Браузеры получают высокий приоритет для URL
-                )
+                ))
+        return apps
     
-    def _discover_tor_browser(self):
+    def _discover_tor_browser(self) -> List[DesktopApp]:
         """Специальное обнаружение Tor Browser"""
         # Стандартные пути установки Tor Browser
         tor_paths = [
@@ -453,58 +1981,308 @@ class AppDiscovery:
         tor_executables = []
         for tor_path in tor_paths:
             if tor_path.exists() and tor_path.is_file():
-                tor_executables.append(tor_path)
+                tor_executables.append(str(tor_path))
         
         # Поиск в PATH
         if self._command_exists('tor-browser'):
             tor_executables.append('tor-browser')
         
-        # Поиск через find (если есть права)
-        try:
-            result = subprocess.run([
-                'find', str(Path.home()), '-name', 'start-tor-browser', 
-                '-type', 'f', '-executable'
-            ], capture_output=True, text=True, timeout=10)
-            
-            if result.returncode == 0:
-                for path in result.stdout.strip().split('\n'):
-                    if path.strip():
-                        tor_executables.append(Path(path.strip()))
-        except Exception:
-            pass
-        
-        # Добавляем найденные экземпляры Tor Browser
+        # Нестандартные места установки: ограниченный обход с кэшем находок
+        for path in self.tor_locator.locate(rescan=self.rescan):
+            if path not in tor_executables:
+                tor_executables.append(path)
+        return self._tor_apps(tor_executables)
+    
+    @staticmethod
+    def _tor_apps(tor_executables: List[str]) -> List[DesktopApp]:
+        """Записи для найденных экземпляров Tor Browser"""
+        apps = []
         for i, tor_exec in enumerate(tor_executables):
             name = 'Tor Browser' if i == 0 else f'Tor Browser ({i+1})'
-            if name not in self.apps:
-                self.apps[name] = DesktopApp(
-                    name=name,
-                    exec_cmd=str(tor_exec),
-                    mime_types=['text/html', 'application/xhtml+xml'],
-                    app_type='browser',
-                    priority=1  # Высокий приоритет для приватности
-                )
+            apps.append(DesktopApp(
+                name=name,
+                exec_cmd=ExecTemplate.quote(tor_exec),
+                mime_types=['text/html', 'application/xhtml+xml'],
+                app_type='browser',
+                categories=['Network', 'WebBrowser'],
+                priority=1  # Высокий приоритет для приватности
+            ))
+        return apps
     
     def _command_exists(self, command: str) -> bool:
         """Проверка существования команды в PATH"""
+        index = self.executables or ExecutableIndex.for_path()
+        return command in index
+
+class UsageSnapshot:
+    """Статистика использования для одной пары (контекст, MIME тип), прочитанная один раз
+
+    Диалог получает оценки всех приложений из словарей в памяти, не обращаясь
+    к хранилищу для каждого приложения.
+    """
+
+    def __init__(self, usage: Dict[str, Tuple[int, int, Optional[float]]], scores: Dict[str, float]):
+        self.usage = usage  # ключ приложения -> (число запусков, время последнего, frecency)
+        self.scores = scores  # ключ приложения -> frecency для пары (контекст, MIME тип)
+        self.now = time.time()
+
+    def get(self, app: DesktopApp) -> Tuple[int, int, float, float]:
+        """Число запусков, время последнего, оценки frecency для пары и общая"""
+        # Старая статистика хранилась по отображаемому имени
+        count, last_used, frecency = self.usage.get(app.usage_key) or self.usage.get(app.name) or (0, 0, None)
+        if frecency is None and count:
+            frecency = _legacy_frecency(count, last_used)
+        return (count, last_used, _frecency_score(self.scores.get(app.usage_key), self.now),
+                _frecency_score(frecency, self.now))
+
+class UsageStore:
+    """SQLite хранилище (WAL) статистики использования и запомненных выборов
+
+    Каждое изменение — одна атомарная вставка или обновление строки, поэтому
+    одновременно запущенные экземпляры не теряют изменения друг друга.
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+        CREATE TABLE IF NOT EXISTS context_choices (
+            context TEXT NOT NULL,
+            mime TEXT NOT NULL,
+            app TEXT NOT NULL,
+            entry TEXT NOT NULL,
+            PRIMARY KEY (context, mime)
+        );
+        CREATE INDEX IF NOT EXISTS context_choices_app ON context_choices (app);
+        CREATE TABLE IF NOT EXISTS usage_stats (
+            app TEXT PRIMARY KEY,
+            count INTEGER NOT NULL DEFAULT 0,
+            last_used INTEGER NOT NULL DEFAULT 0,
+            frecency REAL
+        );
+        CREATE TABLE IF NOT EXISTS context_usage (
+            context TEXT NOT NULL,
+            mime TEXT NOT NULL,
+            app TEXT NOT NULL,
+            frecency REAL NOT NULL,
+            PRIMARY KEY (context, mime, app)
+        );
+        CREATE INDEX IF NOT EXISTS context_usage_app ON context_usage (app);
+    """
+
+    def __init__(self, db_file: Path = USAGE_DB_FILE):
+        import sqlite3
+        db_file.parent.mkdir(parents=True, exist_ok=True)
+        # Автокоммит: каждая инструкция — отдельная короткая транзакция
+        self.db = sqlite3.connect(str(db_file), timeout=5, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        # Пересчёт frecency выполняется внутри UPSERT, атомарно относительно других процессов
+        self.db.create_function('frecency_add', 2, _frecency_add, deterministic=True)
+        self.db.create_function('legacy_frecency', 2, _legacy_frecency, deterministic=True)
+        self.db.executescript(self.SCHEMA)
+        self._upgrade_schema()
+
+    def _upgrade_schema(self):
+        """Добавление колонки frecency в базы, созданные до её появления"""
+        columns = {row[1] for row in self.db.execute('PRAGMA table_info(usage_stats)')}
+        if 'frecency' in columns:
+            return
+        self.db.execute('BEGIN IMMEDIATE')
         try:
-            subprocess.run(['which', command], 
-                         capture_output=True, timeout=2)
-            return True
+            columns = {row[1] for row in self.db.execute('PRAGMA table_info(usage_stats)')}
+            if 'frecency' not in columns:
+                self.db.execute('ALTER TABLE usage_stats ADD COLUMN frecency REAL')
+                self.db.execute('UPDATE usage_stats SET frecency = legacy_frecency(count, last_used)')
+            self.db.execute('COMMIT')
         except Exception:
-            return False
+            self.db.execute('ROLLBACK')
+            raise
+
+    def migrate_from_config(self, config: Dict[str, Any]):
+        """Однократный перенос usage_stats и context_choices из chooser.json"""
+        if self._is_migrated():
+            return
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            # Другой экземпляр мог выполнить перенос, пока мы ждали блокировку
+            if not self._is_migrated():
+                for choice_key, choice in config.get('context_choices', {}).items():
+                    context, _, mime_type = choice_key.partition(':')
+                    entry = {'name': choice} if isinstance(choice, str) else choice
+                    self.db.execute(
+                        'INSERT OR IGNORE INTO context_choices (context, mime, app, entry) VALUES (?, ?, ?, ?)',
+                        (context, mime_type, entry.get('name', ''), json.dumps(entry))
+                    )
+                for app_key, stats in config.get('usage_stats', {}).items():
+                    count, last_used = stats.get('count', 0), stats.get('last_used', 0)
+                    self.db.execute(
+                        'INSERT OR IGNORE INTO usage_stats (app, count, last_used, frecency) VALUES (?, ?, ?, ?)',
+                        (app_key, count, last_used, stats.get('frecency', _legacy_frecency(count, last_used)))
+                    )
+                for choice_key, scores in config.get('context_usage', {}).items():
+                    context, _, mime_type = choice_key.partition(':')
+                    self.db.executemany(
+                        'INSERT OR IGNORE INTO context_usage (context, mime, app, frecency) VALUES (?, ?, ?, ?)',
+                        [(context, mime_type, app_key, value) for app_key, value in scores.items()]
+                    )
+                self.db.execute("INSERT INTO meta (key, value) VALUES ('migrated_from_json', ?)",
+                                (str(int(time.time())),))
+            self.db.execute('COMMIT')
+        except Exception:
+            self.db.execute('ROLLBACK')
+            raise
+        logger.info("Статистика и запомненные выборы перенесены в SQLite")
+
+    def _is_migrated(self) -> bool:
+        return self.db.execute("SELECT 1 FROM meta WHERE key = 'migrated_from_json'").fetchone() is not None
+
+    def get_choice(self, context: str, mime_type: str) -> Optional[Dict[str, Any]]:
+        row = self.db.execute('SELECT entry FROM context_choices WHERE context = ? AND mime = ?',
+                              (context, mime_type)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set_choice(self, context: str, mime_type: str, entry: Dict[str, Any]):
+        self.db.execute(
+            'INSERT INTO context_choices (context, mime, app, entry) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT (context, mime) DO UPDATE SET app = excluded.app, entry = excluded.entry',
+            (context, mime_type, entry.get('name', ''), json.dumps(entry))
+        )
+
+    def clear_choice(self, context: str, mime_type: str):
+        self.db.execute('DELETE FROM context_choices WHERE context = ? AND mime = ?', (context, mime_type))
+
+    def clear_choices(self):
+        self.db.execute('DELETE FROM context_choices')
+
+    def increment_usage(self, app_key: str, legacy_name: str, context: Optional[str],
+                        mime_type: Optional[str], now: int):
+        """Учёт запуска в общей статистике и статистике контекста с компактизацией"""
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            if legacy_name != app_key:
+                # Старая статистика по отображаемому имени переходит на ключ приложения
+                self.db.execute('UPDATE OR IGNORE usage_stats SET app = ? WHERE app = ?', (app_key, legacy_name))
+                self.db.execute('DELETE FROM usage_stats WHERE app = ?', (legacy_name,))
+            self.db.execute(
+                'INSERT INTO usage_stats (app, count, last_used, frecency) VALUES (?, 1, ?, frecency_add(NULL, ?)) '
+                'ON CONFLICT (app) DO UPDATE SET count = count + 1, '
+                'last_used = MAX(last_used, excluded.last_used), '
+                'frecency = frecency_add(frecency, excluded.last_used)',
+                (app_key, now, now)
+            )
+            if context and mime_type:
+                self.db.execute(
+                    'INSERT INTO context_usage (context, mime, app, frecency) VALUES (?, ?, ?, frecency_add(NULL, ?)) '
+                    'ON CONFLICT (context, mime, app) DO UPDATE SET frecency = frecency_add(frecency, ?)',
+                    (context, mime_type, app_key, now, now)
+                )
+            self._compact(now)
+            self.db.execute('COMMIT')
+        except Exception:
+            self.db.execute('ROLLBACK')
+            raise
+
+    def _compact(self, now: int):
+        """Удаление устаревших записей и ограничение размера таблиц"""
+        threshold = _frecency_threshold(now)
+        self.db.execute('DELETE FROM usage_stats WHERE frecency < ?', (threshold,))
+        self.db.execute(
+            'DELETE FROM usage_stats WHERE app NOT IN '
+            '(SELECT app FROM usage_stats ORDER BY frecency DESC LIMIT ?)',
+            (FRECENCY_MAX_APPS,)
+        )
+        self.db.execute('DELETE FROM context_usage WHERE frecency < ?', (threshold,))
+        self.db.execute(
+            'DELETE FROM context_usage WHERE rowid IN (SELECT rowid FROM ('
+            'SELECT rowid, ROW_NUMBER() OVER (PARTITION BY context, mime ORDER BY frecency DESC) AS rank '
+            'FROM context_usage) WHERE rank > ?)',
+            (FRECENCY_MAX_CONTEXT_APPS,)
+        )
+        self.db.execute(
+            'DELETE FROM context_usage WHERE (context, mime) NOT IN '
+            '(SELECT context, mime FROM context_usage GROUP BY context, mime '
+            'ORDER BY MAX(frecency) DESC LIMIT ?)',
+            (FRECENCY_MAX_CONTEXTS,)
+        )
+
+    def load_usage(self, context: str, mime_type: str) -> UsageSnapshot:
+        """Общая статистика (не больше FRECENCY_MAX_APPS строк) и оценки пары двумя запросами"""
+        usage = {row[0]: (row[1], row[2], row[3])
+                 for row in self.db.execute('SELECT app, count, last_used, frecency FROM usage_stats')}
+        scores = dict(self.db.execute('SELECT app, frecency FROM context_usage WHERE context = ? AND mime = ?',
+                                      (context, mime_type)))
+        return UsageSnapshot(usage, scores)
 
 class ConfigManager:
+    """Конфигурация с отложенной записью
+
+    Изменения применяются в памяти и запоминаются; save_config() один раз
+    атомарно записывает их, накладывая поверх версии файла, записанной
+    другими процессами после загрузки.
+    """
+    
     def __init__(self):
+        self.config_signature = self._file_signature()
         self.config = self._load_config()
+        self.generation = 0  # увеличивается при каждом перечитывании файла
+        self._changes = []  # функции изменений для повторного применения при слиянии
+        self.store = self._open_store()
     
+    def _open_store(self) -> Optional[UsageStore]:
+        """SQLite хранилище статистики и выборов, если оно включено в конфигурации"""
+        if self.config.get('storage') != 'sqlite':
+            return None
+        try:
+            store = UsageStore()
+            store.migrate_from_config(self.config)
+            return store
+        except Exception as e:
+            logger.error(f"SQLite хранилище недоступно, используется chooser.json: {e}")
+            return None
+    
+    @staticmethod
+    def _file_signature() -> Optional[Tuple[int, int]]:
+        """Inode и mtime файла: атомарная замена всегда меняет inode, даже в пределах одного тика mtime"""
+        try:
+            st = os.stat(CONFIG_FILE)
+        except OSError:
+            return None
+        return st.st_ino, st.st_mtime_ns
+    
+    @property
+    def dirty(self) -> bool:
+        return bool(self._changes)
+    
+    def reload_if_changed(self):
+        """Перечитывание конфигурации, если файл изменён другим процессом"""
+        signature = self._file_signature()
+        if signature != self.config_signature:
+            self.config_signature = signature
+            self.config = self._load_config()
+            self.generation += 1
+            for apply in self._changes:
+                apply(self.config)
+    
+    def _change(self, apply: Callable[[Dict[str, Any]], None]):
+        """Применение изменения к конфигурации с запоминанием для слияния при записи"""
+        apply(self.config)
+        self._changes.append(apply)
+    
+    @_traced('config.load')
     def _load_config(self) -> Dict[str, Any]:
         """Загрузка конфигурации из файла"""
         default_config = {
             'context_choices': {},
             'custom_apps': [],
             'default_app': None,
-            'usage_stats': {},  # Статистика использования
+            'discovery_timeout': DISCOVERY_TIMEOUT,  # Бюджет времени обнаружения, секунды
+            'context_rules': [],  # Дополнительные правила определения контекста
+            'relevance_rules': [],  # Дополнительные правила релевантности приложений
+            'log_level': None,  # Уровень журнала; по умолчанию WARNING
+            'storage': 'json',  # json или sqlite для usage_stats и context_choices
+            'usage_stats': {},  # Статистика использования по ключу приложения
+            'context_usage': {},  # frecency по паре "контекст:MIME тип"
             'ui_preferences': {  # Настройки UI
                 'window_width': 800,
                 'window_height': 600,
@@ -516,6 +2294,8 @@ class ConfigManager:
                 'sort_column': 'priority',
                 'sort_order': 'desc',
                 'show_all_apps': True,
+                'show_icons': True,
+                'icon_disk_cache': True,  # Уменьшенные копии иконок в ~/.cache
                 'last_geometry': None
             }
         }
@@ -538,107 +2318,695 @@ class ConfigManager:
         
         return default_config
     
+    @_traced('config.save')
     def save_config(self):
-        """Сохранение конфигурации в файл"""
+        """Атомарная запись накопленных изменений (ничего не делает без изменений)"""
+        if not self._changes:
+            return
+        try:
+            CONFIG_DIR.mkdir(parents=True, exist_ok=True)
+            with open(CONFIG_LOCK_FILE, 'w') as lock:
+                # Блокировка сериализует запись параллельно запущенных экземпляров
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                self.reload_if_changed()
+                self._write_atomic(self.config)
+                self.config_signature = self._file_signature()
+                self._changes = []
+        except Exception as e:
+            logger.error(f"Ошибка сохранения конфигурации: {e}")
+    
+    @staticmethod
+    def _write_atomic(config: Dict[str, Any]):
+        """Запись через временный файл, fsync и переименование"""
+        fd, tmp_path = tempfile.mkstemp(dir=str(CONFIG_DIR), prefix='.chooser-')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(config, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, CONFIG_FILE)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+    def get_context_choice(self, context: str, mime_type: str) -> Optional[str]:
+        """Получение запомненного выбора для контекста и MIME типа"""
+        entry = self.get_context_choice_entry(context, mime_type)
+        return entry.get('name') if entry else None
+
+    def get_context_choice_entry(self, context: str, mime_type: str) -> Optional[Dict[str, Any]]:
+        """Получение полной записи запомненного выбора"""
+        if self.store is not None:
+            return self.store.get_choice(context, mime_type)
+        choice = self.config['context_choices'].get(f"{context}:{mime_type}")
+        if isinstance(choice, str):
+            # Старый формат: только имя приложения
+            return {'name': choice}
+        if isinstance(choice, dict):
+            return choice
+        return None
+
+    def set_context_choice(self, context: str, mime_type: str, app: DesktopApp):
+        """Запоминание выбора для контекста и MIME типа"""
+        choice_key = f"{context}:{mime_type}"
+        entry = app.to_choice_entry()
+        if self.store is not None:
+            self.store.set_choice(context, mime_type, entry)
+            return
+        if self.config['context_choices'].get(choice_key) == entry:
+            return
+        
+        def apply(config):
+            config.setdefault('context_choices', {})[choice_key] = entry
+        self._change(apply)
+
+    def clear_context_choice(self, context: str, mime_type: str):
+        """Очистка запомненного выбора для контекста и MIME типа"""
+        if self.store is not None:
+            self.store.clear_choice(context, mime_type)
+            return
+        choice_key = f"{context}:{mime_type}"
+        if choice_key not in self.config['context_choices']:
+            return
+        
+        def apply(config):
+            config.get('context_choices', {}).pop(choice_key, None)
+        self._change(apply)
+
+    def clear_all_associations(self):
+        """Очистка всех ассоциаций"""
+        if self.store is not None:
+            self.store.clear_choices()
+            return
+        
+        def apply(config):
+            config['context_choices'] = {}
+        self._change(apply)
+
+    def add_custom_app(self, entry: Dict[str, Any]):
+        """Добавление пользовательского приложения"""
+        def apply(config):
+            config.setdefault('custom_apps', []).append(entry)
+        self._change(apply)
+
+    def increment_usage(self, app: DesktopApp, context: Optional[str] = None,
+                        mime_type: Optional[str] = None):
+        """Учёт запуска приложения в общей статистике и статистике контекста"""
+        now = int(time.time())
+        app_key = app.usage_key
+        if self.store is not None:
+            self.store.increment_usage(app_key, app.name, context, mime_type, now)
+            return
+        
+        def apply(config):
+            # При слиянии использование добавляется поверх значений других процессов
+            usage = config.setdefault('usage_stats', {})
+            legacy = usage.pop(app.name, None) if app.name != app_key else None
+            stats = usage.get(app_key) or legacy or {'count': 0, 'last_used': 0}
+            usage[app_key] = stats
+            if 'frecency' not in stats:
+                stats['frecency'] = _legacy_frecency(stats.get('count', 0), stats.get('last_used', 0))
+            stats['count'] = stats.get('count', 0) + 1
+            stats['last_used'] = max(stats.get('last_used', 0), now)
+            stats['frecency'] = _frecency_add(stats['frecency'], now)
+            
+            if context and mime_type:
+                scores = config.setdefault('context_usage', {}).setdefault(f"{context}:{mime_type}", {})
+                scores[app_key] = _frecency_add(scores.get(app_key), now)
+            
+            self._compact_usage(config, now)
+        self._change(apply)
+
+    @staticmethod
+    def _compact_usage(config: Dict[str, Any], now: int):
+        """Удаление устаревшей статистики и ограничение её размера"""
+        threshold = _frecency_threshold(now)
+        
+        usage = config.get('usage_stats', {})
+        for stats in usage.values():
+            if 'frecency' not in stats:
+                stats['frecency'] = _legacy_frecency(stats.get('count', 0), stats.get('last_used', 0))
+        kept = sorted(
+            ((app_key, stats) for app_key, stats in usage.items() if stats['frecency'] >= threshold),
+            key=lambda item: item[1]['frecency'], reverse=True
+        )
+        config['usage_stats'] = dict(kept[:FRECENCY_MAX_APPS])
+        
+        contexts = []
+        for choice_key, scores in config.get('context_usage', {}).items():
+            top = sorted(((app_key, value) for app_key, value in scores.items() if value >= threshold),
+                         key=lambda item: item[1], reverse=True)[:FRECENCY_MAX_CONTEXT_APPS]
+            if top:
+                contexts.append((choice_key, dict(top)))
+        contexts.sort(key=lambda item: max(item[1].values()), reverse=True)
+        config['context_usage'] = dict(contexts[:FRECENCY_MAX_CONTEXTS])
+
+    def load_usage(self, context: str, mime_type: str) -> UsageSnapshot:
+        """Статистика использования для пары (контекст, MIME тип), читаемая один раз на диалог"""
+        if self.store is not None:
+            return self.store.load_usage(context, mime_type)
+        usage = {
+            app_key: (stats.get('count', 0), stats.get('last_used', 0), stats.get('frecency'))
+            for app_key, stats in self.config.get('usage_stats', {}).items()
+        }
+        scores = dict(self.config.get('context_usage', {}).get(f"{context}:{mime_type}", {}))
+        return UsageSnapshot(usage, scores)
+
+    def save_ui_preferences(self, prefs: Dict[str, Any]):
+        """Сохранение настроек UI"""
+        current = self.config['ui_preferences']
+        changed = {key: value for key, value in prefs.items() if current.get(key) != value}
+        if not changed:
+            return
+        
+        def apply(config):
+            config.setdefault('ui_preferences', {}).update(changed)
+        self._change(apply)
+
+    def get_ui_preferences(self) -> Dict[str, Any]:
+        """Получение настроек UI"""
+        return self.config.get('ui_preferences', {})
+
+class MimeDetector:
+    """Пакетное определение MIME типов целей с кэшем по (устройство, inode, mtime)
+
+    Если шаблоны имён (globs) дают один тип с наибольшим весом, файл не читается.
+    Остальные файлы анализируются по содержимому параллельно, а результат
+    запоминается, пока файл не изменится или не будет переименован.
+    """
+    DEFAULT_TYPE = 'application/octet-stream'
+    # Используется без pyxdg; ключи в нижнем регистре, как и сравниваемое расширение
+    EXTENSION_MAP = {
+        '.txt': 'text/plain',
+        '.html': 'text/html', '.htm': 'text/html',
+        '.pdf': 'application/pdf',
+        '.png': 'image/png', '.jpg': 'image/jpeg', '.jpeg': 'image/jpeg',
+        '.gif': 'image/gif', '.bmp': 'image/bmp',
+        '.mp4': 'video/mp4', '.avi': 'video/x-msvideo',
+        '.mp3': 'audio/mpeg', '.wav': 'audio/wav',
+        '.zip': 'application/zip', '.tar': 'application/x-tar',
+        '.gz': 'application/gzip',
+        '.deb': 'application/vnd.debian.binary-package',
+        '.appimage': 'application/x-executable'
+    }
+
+    def __init__(self, cache_file: Path = MIME_CACHE_FILE, capacity: int = MIME_CACHE_SIZE):
+        self.cache_file = cache_file
+        self.capacity = capacity
+        self._entries = OrderedDict()  # "dev:inode:mtime_ns" -> [имя файла, MIME тип]
+        self._loaded = False
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    @_traced('mime.detect')
+    def detect(self, targets: List[str], cwd: Optional[str] = None) -> Dict[str, str]:
+        """MIME типы для набора целей: {цель: MIME тип}"""
+        results = {}
+        pending = []  # (цель, путь, ключ кэша, кандидаты по шаблонам имён)
+        for target in targets:
+            if target in results:
+                continue
+            if target.startswith(('http://', 'https://')):
+                results[target] = 'text/html'
+                continue
+            
+            path = target
+            if path.startswith('file://'):
+                from urllib.parse import unquote
+                path = unquote(path[7:])
+            if cwd and not os.path.isabs(path):
+                path = os.path.join(cwd, path)
+            
+            if not HAS_XDG:
+                results[target] = self.EXTENSION_MAP.get(Path(path).suffix.lower(), self.DEFAULT_TYPE)
+                continue
+            
+            try:
+                st = os.stat(path)
+            except OSError:
+                results[target] = self._type_by_name(path)
+                continue
+            if not stat.S_ISREG(st.st_mode):
+                # Директории и специальные файлы определяются по stat без чтения
+                results[target] = self._sniff(path)
+                continue
+            
+            key = f'{st.st_dev}:{st.st_ino}:{st.st_mtime_ns}'
+            cached = self._get(key, os.path.basename(path))
+            if cached:
+                results[target] = cached
+                continue
+            
+            candidates = self._glob_candidates(path)
+            if candidates is not None and len(candidates) == 1:
+                results[target] = candidates[0]
+            else:
+                pending.append((target, path, key))
+        
+        if pending:
+            if len(pending) == 1:
+                sniffed = [self._sniff(pending[0][1])]
+            else:
+                workers = min(MIME_SNIFF_CONCURRENCY, len(pending))
+                with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+                    sniffed = list(pool.map(lambda item: self._sniff(item[1]), pending))
+            for (target, path, key), mime_type in zip(pending, sniffed):
+                results[target] = mime_type
+                self._put(key, os.path.basename(path), mime_type)
+            self.save()
+        
+        return results
+
+    def _type_by_name(self, path: str) -> str:
+        """Тип по имени для несуществующих путей"""
+        try:
+            mime_obj = Mime.get_type_by_name(path)
+            return str(mime_obj) if mime_obj else self.DEFAULT_TYPE
+        except Exception:
+            return self.EXTENSION_MAP.get(Path(path).suffix.lower(), self.DEFAULT_TYPE)
+
+    @staticmethod
+    def _glob_candidates(path: str) -> Optional[List[str]]:
+        """Типы с наибольшим весом шаблона имени; None, если база шаблонов недоступна"""
         try:
-            with open(CONFIG_FILE, 'w') as f:
-                json.dump(self.config, f, indent=2)
+            Mime.update_cache()
+            matches = Mime.globs.all_matches(path)
         except Exception as e:
-            logger.error(f"Ошибка сохранения конфигурации: {e}")
+            logger.debug(f"Шаблоны имён MIME недоступны: {e}")
+            return None
+        if not matches:
+            return []
+        max_weight = max(weight for _, weight in matches)
+        candidates = []
+        for mime_obj, weight in matches:
+            if weight == max_weight and str(mime_obj) not in candidates:
+                candidates.append(str(mime_obj))
+        return candidates
 
-    def get_context_choice(self, context: str, mime_type: str) -> Optional[str]:
-        """Получение запомненного выбора для контекста и MIME типа"""
-        return self.config['context_choices'].get(f"{context}:{mime_type}")
+    @_traced('mime.sniff')
+    def _sniff(self, path: str) -> str:
+        """Определение по содержимому (выполняется в рабочих потоках)"""
+        try:
+            get_type = getattr(Mime, 'get_type2', Mime.get_type)
+            mime_obj = get_type(path)
+            return str(mime_obj) if mime_obj else self.DEFAULT_TYPE
+        except Exception as e:
+            logger.debug(f"Ошибка определения MIME типа {path}: {e}")
+            return self.EXTENSION_MAP.get(Path(path).suffix.lower(), self.DEFAULT_TYPE)
 
-    def set_context_choice(self, context: str, mime_type: str, app_name: str):
-        """Запоминание выбора для контекста и MIME типа"""
-        self.config['context_choices'][f"{context}:{mime_type}"] = app_name
+    def _ensure_loaded(self):
+        """Ленивая загрузка кэша с диска"""
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            with open(self.cache_file, 'r') as f:
+                data = json.load(f)
+            if isinstance(data, dict):
+                self._entries = OrderedDict(
+                    (key, value) for key, value in data.items()
+                    if isinstance(value, list) and len(value) == 2
+                )
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.debug(f"Кэш MIME типов поврежден: {e}")
 
-    def clear_context_choice(self, context: str, mime_type: str):
-        """Очистка запомненного выбора для контекста и MIME типа"""
-        choice_key = f"{context}:{mime_type}"
-        if choice_key in self.config['context_choices']:
-            del self.config['context_choices'][choice_key]
+    def _get(self, key: str, name: str) -> Optional[str]:
+        """Тип из кэша; переименованный файл (тот же inode) определяется заново"""
+        with self._lock:
+            self._ensure_loaded()
+            entry = self._entries.get(key)
+            if not entry or entry[0] != name:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
 
-    def clear_all_associations(self):
-        """Очистка всех ассоциаций"""
-        self.config['context_choices'] = {}
+    def _put(self, key: str, name: str, mime_type: str):
+        with self._lock:
+            self._ensure_loaded()
+            self._entries[key] = [name, mime_type]
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+            self._dirty = True
 
-    def increment_usage(self, app_name: str):
-        """Увеличение счетчика использования приложения"""
-        if 'usage_stats' not in self.config:
-            self.config['usage_stats'] = {}
-        
-        if app_name not in self.config['usage_stats']:
-            self.config['usage_stats'][app_name] = {
-                'count': 0,
-                'last_used': 0
-            }
-        
-        self.config['usage_stats'][app_name]['count'] += 1
-        self.config['usage_stats'][app_name]['last_used'] = int(time.time())
+    @_traced('mime.cache_save')
+    def save(self):
+        """Атомарная запись кэша на диск (только при изменениях)"""
+        with self._lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+            try:
+                self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(dir=str(self.cache_file.parent), prefix='.mime-')
+                try:
+                    with os.fdopen(fd, 'w') as f:
+                        json.dump(self._entries, f, separators=(',', ':'))
+                    os.replace(tmp_path, self.cache_file)
+                except Exception:
+                    try:
+                        os.unlink(tmp_path)
+                    except OSError:
+                        pass
+                    raise
+            except Exception as e:
+                logger.debug(f"Ошибка сохранения кэша MIME типов: {e}")
 
-    def get_usage_stats(self, app_name: str) -> Tuple[int, int]:
-        """Получение статистики использования приложения"""
-        stats = self.config.get('usage_stats', {}).get(app_name, {})
-        return stats.get('count', 0), stats.get('last_used', 0)
+class ContextDetector:
+    """Определение контекста вызова по цепочке родительских процессов из /proc
 
-    def save_ui_preferences(self, prefs: Dict[str, Any]):
-        """Сохранение настроек UI"""
-        self.config['ui_preferences'].update(prefs)
+    Правила компилируются один раз; результат кэшируется для родительского
+    процесса (PID и время его запуска), поэтому повторное определение в
+    резидентном режиме не читает /proc.
+    """
 
-    def get_ui_preferences(self) -> Dict[str, Any]:
-        """Получение настроек UI"""
-        return self.config.get('ui_preferences', {})
+    def __init__(self, rules: Optional[List[Dict[str, Any]]] = None):
+        self.rules = self._compile_rules(list(rules or []) + DEFAULT_CONTEXT_RULES)
+        self._cache = OrderedDict()  # (PPID, время запуска) -> контекст, LRU
 
-class ContextDetector:
     @staticmethod
-    def get_invoker_context() -> str:
-        """Определение контекста вызова приложения"""
+    def _compile_rules(rules: List[Dict[str, Any]]) -> List[Tuple[str, str, Any, int, bool]]:
+        """Правила в виде (контекст, поле, регулярное выражение, max_depth, fallback)"""
+        compiled = []
+        for rule in rules:
+            try:
+                field = 'cmdline' if 'cmdline' in rule else 'comm'
+                pattern = re.compile(rule[field], re.IGNORECASE)
+                compiled.append((str(rule['context']), field, pattern, int(rule.get('max_depth', 0)),
+                                 bool(rule.get('fallback', False))))
+            except (KeyError, TypeError, ValueError, re.error) as e:
+                logger.warning(f"Некорректное правило контекста {rule}: {e}")
+        return compiled
+
+    @_traced('context.detect')
+    def get_invoker_context(self, environ: Optional[Dict[str, str]] = None,
+                            ppid: Optional[int] = None) -> str:
+        """Определение контекста вызова приложения
+
+        environ и ppid (родитель вызывающего процесса) позволяют определить контекст
+        другого процесса (клиента резидентного режима); по умолчанию используется
+        родитель текущего процесса.
+        """
+        if environ is None:
+            environ = os.environ
+        
         # Проверяем переменные окружения
-        if os.environ.get('CURSOR_SESSION'):
+        if environ.get('CURSOR_SESSION'):
             return 'cursor'
-        if os.environ.get('VSCODE_PID'):
+        if environ.get('VSCODE_PID'):
             return 'vscode'
-        if os.environ.get('TERMINAL'):
+        if environ.get('TERMINAL'):
             return 'terminal'
         
         # Проверяем родительские процессы
-        try:
-            import psutil
-            current = psutil.Process()
-            for parent in current.parents():
-                parent_name = parent.name().lower()
-                if 'cursor' in parent_name:
-                    return 'cursor'
-                elif 'code' in parent_name:
-                    return 'vscode'
-                elif any(term in parent_name for term in ['terminal', 'konsole', 'gnome-terminal']):
-                    return 'terminal'
-                elif any(fm in parent_name for fm in ['nautilus', 'dolphin', 'thunar', 'nemo']):
-                    return 'filemanager'
-        except ImportError:
-            pass
+        if ppid is None:
+            ppid = os.getppid()
+        info = self._read_stat(ppid) if ppid > 0 else None
+        if info is None:
+            return 'unknown'
         
-        # Fallback определение через PPID
+        key = (ppid, info[2])
+        context = self._cache.get(key)
+        if context is None:
+            context = self._match_ancestors(ppid, info)
+            self._cache[key] = context
+            while len(self._cache) > CONTEXT_CACHE_SIZE:
+                self._cache.popitem(last=False)
+        else:
+            self._cache.move_to_end(key)
+        return context
+
+    def _match_ancestors(self, pid: int, info: Tuple[str, int, int]) -> str:
+        """Первое правило, совпавшее с ближайшим предком; правила fallback — если других совпадений нет"""
+        fallback_context = None
+        for depth in range(1, CONTEXT_MAX_DEPTH + 1):
+            comm, parent, _ = info
+            cmdline = None
+            for context, field, pattern, max_depth, fallback in self.rules:
+                if max_depth and depth > max_depth:
+                    continue
+                if fallback and fallback_context is not None:
+                    continue
+                if field == 'comm':
+                    value = comm
+                else:
+                    # Командная строка читается, только если до неё дошла проверка
+                    if cmdline is None:
+                        cmdline = self._read_cmdline(pid)
+                    value = cmdline
+                if pattern.search(value):
+                    if not fallback:
+                        return context
+                    fallback_context = context
+            
+            if parent <= 1:
+                break
+            pid = parent
+            info = self._read_stat(pid)
+            if info is None:
+                break
+        return fallback_context or 'unknown'
+
+    @staticmethod
+    def _read_stat(pid: int) -> Optional[Tuple[str, int, int]]:
+        """Имя процесса, PPID и время запуска из /proc/<pid>/stat"""
         try:
-            result = subprocess.run(['ps', '-p', str(os.getppid()), '-o', 'comm='], 
-                                  capture_output=True, text=True, timeout=2)
-            if result.returncode == 0:
-                parent_name = result.stdout.strip().lower()
-                if 'cursor' in parent_name:
-                    return 'cursor'
-                elif any(term in parent_name for term in ['terminal', 'bash', 'zsh']):
-                    return 'terminal'
-        except Exception:
-            pass
+            with open(f'/proc/{pid}/stat', 'rb') as f:
+                stat_line = f.read().decode('utf-8', 'replace')
+            # Имя процесса в скобках может содержать пробелы и скобки
+            name_start = stat_line.index('(')
+            name_end = stat_line.rindex(')')
+            fields = stat_line[name_end + 2:].split()
+            return stat_line[name_start + 1:name_end], int(fields[1]), int(fields[19])
+        except (OSError, ValueError, IndexError):
+            return None
+
+    @staticmethod
+    def _read_cmdline(pid: int) -> str:
+        """Командная строка процесса из /proc/<pid>/cmdline"""
+        try:
+            with open(f'/proc/{pid}/cmdline', 'rb') as f:
+                return f.read().replace(b'\0', b' ').decode('utf-8', 'replace').strip()
+        except OSError:
+            return ''
+
+class RelevanceRules:
+    """Релевантность приложений для класса цели по таблице правил
+
+    Правила компилируются один раз в битовые маски по классу цели; для каждого
+    приложения флаги совпавших правил (по имени, Categories= и Keywords=)
+    вычисляются один раз и хранятся в записи. Оценка — чистая функция
+    приложения и класса цели и не меняет приложение.
+    """
+
+    EFFECTS = ('prefer', 'exclude')
+
+    def __init__(self, rules: Optional[List[Dict[str, Any]]] = None):
+        self.rules = []  # (шаблон имени, категории, ключевые слова)
+        self.masks = {effect: {} for effect in self.EFFECTS}  # эффект -> класс цели -> биты правил
+        for rule in DEFAULT_RELEVANCE_RULES + list(rules or []):
+            self._add_rule(rule)
+
+    def _add_rule(self, rule: Dict[str, Any]):
+        """Компиляция одного правила"""
+        try:
+            target, effect = str(rule['target']), rule['effect']
+            if effect not in self.EFFECTS:
+                raise ValueError(f"неизвестный эффект {effect}")
+            names = [str(name).lower() for name in rule.get('names', [])]
+            pattern = re.compile('|'.join(map(re.escape, names))) if names else None
+            categories = {str(category).lower() for category in rule.get('categories', [])}
+            keywords = {str(keyword).lower() for keyword in rule.get('keywords', [])}
+        except (KeyError, TypeError, ValueError) as e:
+            logger.warning(f"Некорректное правило релевантности {rule}: {e}")
+            return
+        bit = 1 << len(self.rules)
+        self.rules.append((pattern, categories, keywords))
+        masks = self.masks[effect]
+        masks[target] = masks.get(target, 0) | bit
+
+    @staticmethod
+    def target_class(target: str, mime_type: str) -> str:
+        """Класс цели: web, image, video, audio, pdf или other"""
+        if target.startswith(('http://', 'https://')):
+            return 'web'
+        mime_str = str(mime_type).lower()
+        media = mime_str.split('/', 1)[0]
+        if media in ('image', 'video', 'audio'):
+            return media
+        if 'pdf' in mime_str:
+            return 'pdf'
+        return 'other'
+
+    def flags(self, app: DesktopApp) -> int:
+        """Биты правил, совпавших с приложением (кэшируются в записи)"""
+        cached = app.relevance_flags
+        if cached is not None and cached[0] is self:
+            return cached[1]
+        name = app.name.lower()
+        categories = {category.lower() for category in app.categories}
+        keywords = {keyword.lower() for keyword in app.keywords}
+        flags = 0
+        for bit, (pattern, rule_categories, rule_keywords) in enumerate(self.rules):
+            if ((pattern is not None and pattern.search(name))
+                    or not rule_categories.isdisjoint(categories)
+                    or not rule_keywords.isdisjoint(keywords)):
+                flags |= 1 << bit
+        app.relevance_flags = (self, flags)
+        return flags
+
+    def score(self, app: DesktopApp, target_class: str) -> Optional[int]:
+        """None — приложение исключено для класса цели, 1 — рекомендуемое, 0 — обычное"""
+        flags = self.flags(app)
+        if flags & self.masks['exclude'].get(target_class, 0):
+            return None
+        return 1 if flags & self.masks['prefer'].get(target_class, 0) else 0
+
+class IconLoader:
+    """Фоновая загрузка иконок приложений с LRU кэшем в памяти и кэшем уменьшенных копий на диске
+
+    Поиск в теме и декодирование выполняются в отдельном потоке; главный
+    поток только берёт готовые иконки из кэша.
+    """
+    _default = None
+
+    def __init__(self, size: int = ICON_SIZE, capacity: int = ICON_CACHE_SIZE,
+                 disk_cache_dir: Optional[Path] = ICON_CACHE_DIR):
+        self.size = size
+        self.capacity = capacity
+        self.disk_cache_dir = disk_cache_dir
+        self._cache = OrderedDict()  # иконка -> Pixbuf или None, если не найдена
+        self._pending = {}  # иконка -> обработчики, ожидающие загрузки
+        self._queue = queue.LifoQueue()  # последние запрошенные строки видны пользователю сейчас
+        self._thread = None
+        self._theme_name = None
+
+    @classmethod
+    def get_default(cls, disk_cache: bool = True) -> 'IconLoader':
+        """Общий загрузчик процесса: в резидентном режиме кэш переживает диалог"""
+        if cls._default is None:
+            cls._default = cls(disk_cache_dir=ICON_CACHE_DIR if disk_cache else None)
+        return cls._default
+
+    def lookup(self, icon: str, on_loaded: Callable[[], None]):
+        """Иконка из кэша (только главный поток)
+
+        При промахе загрузка ставится в очередь, а on_loaded вызывается
+        в главном потоке, когда иконка появится в кэше.
+        """
+        if not icon:
+            return None
+        if icon in self._cache:
+            self._cache.move_to_end(icon)
+            return self._cache[icon]
+        
+        waiting = self._pending.get(icon)
+        if waiting is not None:
+            if on_loaded not in waiting:
+                waiting.append(on_loaded)
+            return None
+        
+        self._pending[icon] = [on_loaded]
+        if self._thread is None:
+            # Имя темы читается в главном потоке; сам поток работает с собственным объектом темы
+            self._theme_name = Gtk.Settings.get_default().get_property('gtk-icon-theme-name') or 'hicolor'
+            self._thread = threading.Thread(target=self._worker, name='icon-loader', daemon=True)
+            self._thread.start()
+        self._queue.put(icon)
+        return None
+
+    def _worker(self):
+        """Поток загрузки иконок"""
+        theme = Gtk.IconTheme.new()
+        theme.set_custom_theme(self._theme_name)
+        while True:
+            icon = self._queue.get()
+            try:
+                pixbuf = self._load(theme, icon)
+            except Exception as e:
+                logger.debug(f"Ошибка загрузки иконки {icon}: {e}")
+                pixbuf = None
+            GLib.idle_add(self._deliver, icon, pixbuf)
+
+    def _deliver(self, icon: str, pixbuf) -> bool:
+        """Помещение загруженной иконки в кэш (главный поток)"""
+        self._cache[icon] = pixbuf
+        while len(self._cache) > self.capacity:
+            self._cache.popitem(last=False)
+        for on_loaded in self._pending.pop(icon, ()):
+            on_loaded()
+        return False
+
+    def _load(self, theme, icon: str):
+        """Поиск файла иконки и декодирование до нужного размера"""
+        if os.path.isabs(icon):
+            path = icon
+        else:
+            # Устаревшие записи указывают имя с расширением
+            if icon.endswith(('.png', '.svg', '.xpm')):
+                icon = icon.rsplit('.', 1)[0]
+            info = theme.lookup_icon(icon, self.size, Gtk.IconLookupFlags.FORCE_SIZE)
+            if info is None:
+                return None
+            path = info.get_filename()
+            if not path:
+                # Встроенные в ресурсы иконки не имеют файла
+                return info.load_icon()
+        
+        thumbnail = self._thumbnail_path(path)
+        if thumbnail is not None and thumbnail.exists():
+            try:
+                return GdkPixbuf.Pixbuf.new_from_file(str(thumbnail))
+            except Exception as e:
+                logger.debug(f"Повреждённая копия иконки {thumbnail}: {e}")
         
-        return 'unknown'
+        pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_scale(path, self.size, self.size, True)
+        if thumbnail is not None:
+            self._save_thumbnail(pixbuf, thumbnail)
+        return pixbuf
+
+    def _thumbnail_path(self, path: str) -> Optional[Path]:
+        """Файл уменьшенной копии: ключ — путь иконки, её mtime и размер"""
+        if self.disk_cache_dir is None:
+            return None
+        import hashlib
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+        key = hashlib.sha1(f'{path}\0{mtime}\0{self.size}'.encode('utf-8', 'surrogateescape')).hexdigest()
+        return self.disk_cache_dir / f'{key}.png'
+
+    def _save_thumbnail(self, pixbuf, thumbnail: Path):
+        """Атомарная запись уменьшенной копии"""
+        try:
+            thumbnail.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=str(thumbnail.parent), prefix='.icon-')
+            os.close(fd)
+            try:
+                pixbuf.savev(tmp_path, 'png', [], [])
+                os.replace(tmp_path, thumbnail)
+            except Exception:
+                os.unlink(tmp_path)
+                raise
+        except Exception as e:
+            logger.debug(f"Ошибка сохранения копии иконки {thumbnail}: {e}")
 
 class AppChooserDialog:
     def __init__(self, apps: Dict[str, DesktopApp], targets: List[str], 
-                 context: str, mime_type: str, config_manager: ConfigManager):
+                 context: str, mime_type: str, config_manager: ConfigManager,
+                 mime_index: Optional[MimeIndex] = None, relevance: Optional[RelevanceRules] = None,
+                 search_index: Optional[concurrent.futures.Future] = None):
         self.apps = apps
+        self.mime_index = mime_index
+        self.relevance = relevance or RelevanceRules()
+        self.target_class = RelevanceRules.target_class(targets[0], mime_type)
+        self.priorities = {}  # имя -> приоритет для этой цели; записи приложений не меняются
+        self.search_index = None  # готов после фоновой синхронизации с реестром
+        self._search_pending = []  # изменения реестра, пришедшие до готовности индекса
+        self.icon_loader = None
         self.targets = targets
         self.context = context
         self.mime_type = mime_type
@@ -646,47 +3014,122 @@ class AppChooserDialog:
         self.selected_app = None
         self.remember_choice = False
         self.show_all_apps = True
+        self.list_store = None
+        self.filter_model = None
+        self.sort_model = None
+        self._row_iters = {}  # имя приложения -> строка в list_store
+        self._closed = False
+        self._search_text = ''
+        self._search_ranks = {}  # имя -> ключ сортировки результатов поиска
+        self._search_timeout = None
+        self._user_sort = None  # сортировка пользователя, заменённая ранжированием поиска
+        self._last_selected = None  # имя последнего выбранного приложения
         
         # Загружаем настройки UI
         self.ui_prefs = config_manager.get_ui_preferences()
         
-        # Применяем статистику использования к приложениям
+        # Применяем статистику использования к приложениям (одно чтение хранилища на диалог)
+        self.usage = config_manager.load_usage(context, mime_type)
         self._apply_usage_stats()
         
         # Фильтруем и сортируем приложения
         self.filtered_apps = self._filter_and_sort_apps()
         
+        if search_index is not None:
+            search_index.add_done_callback(
+                lambda future: GLib.idle_add(self._on_search_index_ready, future))
+        
     def _apply_usage_stats(self):
         """Применение статистики использования к приложениям"""
         for app in self.apps.values():
-            usage_count, last_used = self.config_manager.get_usage_stats(app.name)
-            app.usage_count = usage_count
-            app.last_used = last_used
-            
-            # Определяем приоритет на основе использования
-            if usage_count >= 10:  # Часто используемое
-                app.priority = max(app.priority, 2)
-            elif usage_count >= 3:  # Умеренно используемое
-                app.priority = max(app.priority, 1)
+            self._apply_usage_stats_to(app)
+    
+    def _apply_usage_stats_to(self, app: DesktopApp):
+        """Применение статистики использования к одному приложению"""
+        usage_count, last_used, context_score, global_score = self.usage.get(app)
+        app.usage_count = usage_count
+        app.last_used = last_used
+        # Использование для этого контекста и MIME типа важнее общей привычки
+        app.frecency = context_score + FRECENCY_GLOBAL_WEIGHT * global_score
+        
+        # Приоритет: базовый, правила релевантности, затем недавнее и частое использование
+        priority = max(app.priority, self.relevance.score(app, self.target_class) or 0)
+        if app.frecency >= FRECENCY_FREQUENT:  # Часто используемое
+            priority = 2
+        elif app.frecency >= FRECENCY_RECOMMENDED:  # Умеренно используемое
+            priority = max(priority, 1)
+        self.priorities[app.name] = priority
     
     def _filter_and_sort_apps(self) -> Dict[str, DesktopApp]:
         """Фильтрация и сортировка приложений"""
         # Фильтруем по совместимости и релевантности
+        if self.mime_index is not None:
+            self._candidates = self.mime_index.lookup(self.mime_type)
+        else:
+            self._candidates = {name for name, app in self.apps.items() if app.can_open(self.mime_type)}
+        
         compatible_apps = {}
-        for name, app in self.apps.items():
-            if app.can_open(self.mime_type) and app.is_relevant_for_target(self.targets[0], self.mime_type):
+        for name in self._candidates:
+            app = self.apps.get(name)
+            if app and self._is_compatible(app):
                 compatible_apps[name] = app
         
-        # Сортируем по приоритету, затем по использованию, затем по имени
+        # Сортируем по приоритету, затем по frecency, затем по имени
+        priorities = self.priorities
         sorted_apps = dict(sorted(
             compatible_apps.items(),
-            key=lambda x: (-x[1].priority, -x[1].usage_count, x[1].name.lower())
+            key=lambda x: (-priorities.get(x[0], x[1].priority), -x[1].frecency, x[1].name.lower())
         ))
         
         return sorted_apps
     
+    def _is_compatible(self, app: DesktopApp) -> bool:
+        """Показывать ли приложение для текущей цели"""
+        # NoDisplay записи показываются только для явно объявленных MIME типов
+        if app.no_display and not app.mime_types:
+            return False
+        return self.relevance.score(app, self.target_class) is not None
+    
+    def update_apps(self, changed: List[DesktopApp], removed: List[str]):
+        """Добавление результатов фонового обнаружения; можно вызывать из любого потока"""
+        GLib.idle_add(self._apply_app_updates, changed, removed)
+    
+    def _apply_app_updates(self, changed: List[DesktopApp], removed: List[str]) -> bool:
+        """Применение результатов обнаружения в главном потоке без перестроения списка"""
+        if self._closed:
+            return False
+        
+        self._update_search_index(changed, removed)
+        for name in removed:
+            self.apps.pop(name, None)
+            self.filtered_apps.pop(name, None)
+            self.priorities.pop(name, None)
+        
+        for app in changed:
+            self.apps[app.name] = app
+            self._apply_usage_stats_to(app)
+            if ((app.name in self._candidates or app.can_open(self.mime_type))
+                    and self._is_compatible(app)):
+                self.filtered_apps[app.name] = app
+            else:
+                self.filtered_apps.pop(app.name, None)
+        
+        if self._search_text:
+            self._update_search_ranks()
+        
+        # Строки обновляются на месте: сортировка и выделение сохраняются
+        if self.list_store is not None:
+            for name in removed:
+                self._update_row(name)
+            for app in changed:
+                self._update_row(app.name)
+        return False
+    
     def show(self) -> Tuple[Optional[DesktopApp], bool]:
         """Показ диалога выбора приложения"""
+        _import_gtk()
+        build_started = time.perf_counter_ns()
+        
         dialog = Gtk.Dialog(
             title="Выберите приложение",
             modal=True,
@@ -723,6 +3166,7 @@ class AppChooserDialog:
         # Чекбокс показать все приложения
         self.show_all_checkbox = Gtk.CheckButton(label="Показать все приложения")
         self.show_all_checkbox.set_active(self.ui_prefs.get('show_all_apps', True))
+        self.show_all_apps = self.show_all_checkbox.get_active()
         self.show_all_checkbox.connect("toggled", self._on_show_all_toggled)
         content_area.pack_start(self.show_all_checkbox, False, False, 0)
         
@@ -730,8 +3174,12 @@ class AppChooserDialog:
         search_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=5)
         search_label = Gtk.Label(label="Поиск:")
         self.search_entry = Gtk.Entry()
-        self.search_entry.set_placeholder_text("Введите название приложения...")
+        self.search_entry.set_placeholder_text("Название, ключевые слова или команда...")
+        self._search_text = ''
+        self._search_ranks = {}
+        self._user_sort = None
         self.search_entry.connect("changed", self._on_search_changed)
+        self.search_entry.connect("activate", self._on_search_activate)
         search_box.pack_start(search_label, False, False, 0)
         search_box.pack_start(self.search_entry, True, True, 0)
         content_area.pack_start(search_box, False, False, 0)
@@ -759,9 +3207,16 @@ class AppChooserDialog:
         
         # Обновляем список приложений
         self._update_app_list()
+        _record_span('dialog.build', build_started, apps=len(self.filtered_apps))
         
         # Показываем диалог
-        response = dialog.run()
+        self.dialog = dialog
+        with _span('dialog.run'):
+            response = dialog.run()
+        self._closed = True
+        if self._search_timeout is not None:
+            GLib.source_remove(self._search_timeout)
+            self._search_timeout = None
         
         # Сохраняем настройки UI перед закрытием
         self._save_ui_state(dialog)
@@ -773,8 +3228,8 @@ class AppChooserDialog:
                 app_name = model[treeiter][0]
                 selected_app = self.filtered_apps.get(app_name)
                 
-                # Проверяем доступность приложения
-                if selected_app and not selected_app.is_available:
+                # Проверяем доступность приложения (фоновая проверка могла не завершиться)
+                if selected_app and not selected_app.check_availability():
                     # Показываем диалог подтверждения для недоступного приложения
                     if self._confirm_install_app(selected_app, dialog):
                         self.selected_app = selected_app
@@ -782,6 +3237,7 @@ class AppChooserDialog:
                     else:
                         # Пользователь отменил, не закрываем диалог
                         dialog.destroy()
+                        self._closed = False
                         return self.show()  # Показываем диалог заново
                 else:
                     self.selected_app = selected_app
@@ -792,16 +3248,31 @@ class AppChooserDialog:
     
     def _create_tree_view(self):
         """Создание TreeView с настраиваемыми колонками"""
-        # Модель данных: название, тип, приоритет, использование
+        # Модель данных: название, тип, приоритет, использование.
+        # Строки заполняются один раз; поиск и флажок только скрывают их
+        # через фильтр, сортировка выполняется поверх видимых строк.
         self.list_store = Gtk.ListStore(str, str, str, str)
+        self.filter_model = self.list_store.filter_new()
+        self.filter_model.set_visible_func(self._row_visible)
+        self.sort_model = Gtk.TreeModelSort(model=self.filter_model)
+        # Сортировка по умолчанию ранжирует результаты поиска
+        self.sort_model.set_default_sort_func(self._compare_search_rank)
         
-        self.tree_view = Gtk.TreeView(model=self.list_store)
+        self.tree_view = Gtk.TreeView(model=self.sort_model)
+        self.tree_view.get_selection().connect("changed", self._on_selection_changed)
         self.tree_view.set_headers_visible(True)
         self.tree_view.set_reorderable(False)
         self.tree_view.set_search_column(0)
         
         # Колонка названия
         name_column = Gtk.TreeViewColumn("Приложение")
+        if self.ui_prefs.get('show_icons', True):
+            # Иконки запрашиваются только для строк, которые GTK действительно отрисовывает
+            self.icon_loader = IconLoader.get_default(self.ui_prefs.get('icon_disk_cache', True))
+            icon_renderer = Gtk.CellRendererPixbuf()
+            icon_renderer.set_fixed_size(ICON_SIZE, ICON_SIZE)
+            name_column.pack_start(icon_renderer, False)
+            name_column.set_cell_data_func(icon_renderer, self._render_icon)
         name_renderer = Gtk.CellRendererText()
         name_column.pack_start(name_renderer, True)
         name_column.add_attribute(name_renderer, "text", 0)
@@ -847,55 +3318,210 @@ class AppChooserDialog:
         column_map = {'name': 0, 'type': 1, 'priority': 2, 'usage': 3}
         if sort_column in column_map:
             sort_type = Gtk.SortType.DESCENDING if sort_order == 'desc' else Gtk.SortType.ASCENDING
-            self.list_store.set_sort_column_id(column_map[sort_column], sort_type)
+            self.sort_model.set_sort_column_id(column_map[sort_column], sort_type)
     
     def _update_app_list(self):
-        """Обновление списка приложений"""
+        """Заполнение списка приложений"""
         self.list_store.clear()
-        
-        search_text = self.search_entry.get_text().lower() if hasattr(self, 'search_entry') else ""
-        show_all = self.show_all_checkbox.get_active() if hasattr(self, 'show_all_checkbox') else True
+        self._row_iters = {}
         
         for name, app in self.filtered_apps.items():
-            # Фильтр поиска
-            if search_text and search_text not in name.lower():
-                continue
-            
-            # Фильтр показа всех приложений
-            if not show_all and app.priority == 0 and app.usage_count == 0:
-                continue
-            
-            # Определяем статус приложения
-            if not app.is_available:
-                status = "❌ Установить"
-            elif app.priority == 2:
-                status = "★★ Часто используемое"
-            elif app.priority == 1:
-                status = "★ Рекомендуемое"
-            elif app.usage_count > 0:
-                status = f"Использовано {app.usage_count}x"
-            else:
-                status = "✅ Доступно"
-            
-            # Тип приложения
-            type_map = {
-                'desktop': 'Системное',
-                'flatpak': 'Flatpak',
-                'snap': 'Snap',
-                'browser': 'Браузер',
-                'custom': 'Пользовательское'
-            }
-            app_type = type_map.get(app.app_type, app.app_type.title())
-            
-            self.list_store.append([name, app_type, status, str(app.usage_count)])
+            self._row_iters[name] = self.list_store.append(self._row_values(name, app))
+    
+    def _update_row(self, name: str):
+        """Добавление, обновление или удаление одной строки списка"""
+        app = self.filtered_apps.get(name)
+        treeiter = self._row_iters.get(name)
+        
+        if app is None:
+            if treeiter is not None:
+                self.list_store.remove(treeiter)
+                del self._row_iters[name]
+            return
+        
+        if treeiter is None:
+            self._row_iters[name] = self.list_store.append(self._row_values(name, app))
+        else:
+            self.list_store.set_row(treeiter, self._row_values(name, app))
+    
+    def _render_icon(self, column, cell, model, treeiter, data):
+        """Иконка строки из кэша; при промахе загрузка идёт в фоне"""
+        app = self.filtered_apps.get(model.get_value(treeiter, 0))
+        pixbuf = self.icon_loader.lookup(app.icon, self._on_icon_loaded) if app else None
+        cell.set_property('pixbuf', pixbuf)
+    
+    def _on_icon_loaded(self):
+        """Перерисовка списка после загрузки иконки (GTK объединяет запросы в один кадр)"""
+        if not self._closed:
+            self.tree_view.queue_draw()
+    
+    def _row_visible(self, model, treeiter, data) -> bool:
+        """Функция видимости строки для TreeModelFilter"""
+        name = model.get_value(treeiter, 0)
+        app = self.filtered_apps.get(name)
+        return app is not None and self._matches_filters(name, app)
+    
+    def _matches_filters(self, name: str, app: DesktopApp) -> bool:
+        """Проверка строки по поиску и флажку показа всех приложений"""
+        # Фильтр поиска
+        if self._search_text and name not in self._search_ranks:
+            return False
+        
+        # Фильтр показа всех приложений
+        priority = self.priorities.get(name, app.priority)
+        if not self.show_all_apps and priority == 0 and app.usage_count == 0:
+            return False
+        
+        return True
+    
+    def _refilter(self):
+        """Повторное применение фильтра с сохранением выделенной строки"""
+        self.filter_model.refilter()
+        
+        selection = self.tree_view.get_selection()
+        if selection.count_selected_rows() or self._last_selected is None:
+            return
+        
+        # Строка могла скрыться и снова появиться: возвращаем выделение
+        store_iter = self._row_iters.get(self._last_selected)
+        if store_iter is None:
+            return
+        ok, filter_iter = self.filter_model.convert_child_iter_to_iter(store_iter)
+        if not ok:
+            return
+        ok, sort_iter = self.sort_model.convert_child_iter_to_iter(filter_iter)
+        if ok:
+            selection.select_iter(sort_iter)
+            self.tree_view.scroll_to_cell(self.sort_model.get_path(sort_iter), None, False, 0, 0)
+    
+    def _on_selection_changed(self, selection):
+        """Запоминание выбранного приложения"""
+        model, treeiter = selection.get_selected()
+        if treeiter is not None:
+            self._last_selected = model.get_value(treeiter, 0)
+    
+    def _row_values(self, name: str, app: DesktopApp) -> List[str]:
+        """Значения колонок для строки приложения"""
+        # Определяем статус приложения
+        priority = self.priorities.get(name, app.priority)
+        if app.is_available is None:
+            status = "⏳ Проверка..."
+        elif not app.is_available:
+            status = "❌ Установить"
+        elif priority == 2:
+            status = "★★ Часто используемое"
+        elif priority == 1:
+            status = "★ Рекомендуемое"
+        elif app.usage_count > 0:
+            status = f"Использовано {app.usage_count}x"
+        else:
+            status = "✅ Доступно"
+        
+        # Тип приложения
+        type_map = {
+            'desktop': 'Системное',
+            'flatpak': 'Flatpak',
+            'snap': 'Snap',
+            'browser': 'Браузер',
+            'custom': 'Пользовательское'
+        }
+        app_type = type_map.get(app.app_type, app.app_type.title())
+        
+        return [name, app_type, status, str(app.usage_count)]
     
     def _on_show_all_toggled(self, checkbox):
         """Обработчик переключения показа всех приложений"""
-        self._update_app_list()
+        self.show_all_apps = checkbox.get_active()
+        self._refilter()
     
     def _on_search_changed(self, entry):
-        """Обработчик изменения поискового запроса"""
-        self._update_app_list()
+        """Обработчик изменения поискового запроса (применяется после паузы ввода)"""
+        if self._search_timeout is not None:
+            GLib.source_remove(self._search_timeout)
+        self._search_timeout = GLib.timeout_add(SEARCH_DEBOUNCE_MS, self._apply_search)
+    
+    def _apply_search(self) -> bool:
+        """Применение поискового запроса"""
+        self._search_timeout = None
+        self._search_text = self.search_entry.get_text().strip()
+        self._update_search_ranks()
+        self._refilter()
+        
+        if self._search_text:
+            # Пока идёт поиск, строки упорядочены по рангу совпадения
+            if self._user_sort is None:
+                self._user_sort = self.sort_model.get_sort_column_id()
+            self.sort_model.set_sort_column_id(Gtk.TREE_SORTABLE_DEFAULT_SORT_COLUMN_ID,
+                                               Gtk.SortType.ASCENDING)
+            # Повторная установка функции пересортировывает модель под новые ранги
+            self.sort_model.set_default_sort_func(self._compare_search_rank)
+        elif self._user_sort is not None:
+            sort_column_id, sort_order = self._user_sort
+            self._user_sort = None
+            if sort_column_id is not None:
+                self.sort_model.set_sort_column_id(sort_column_id, sort_order)
+        return False
+    
+    def _update_search_index(self, changed: List[DesktopApp], removed: List[str]):
+        """Перенос изменений реестра в индекс поиска; до его готовности они откладываются"""
+        if self.search_index is None:
+            self._search_pending.append((changed, removed))
+            return
+        for name in removed:
+            self.search_index.remove(name)
+        for app in changed:
+            self.search_index.add(app)
+    
+    def _on_search_index_ready(self, future: concurrent.futures.Future) -> bool:
+        """Индекс поиска синхронизирован с реестром (главный поток)"""
+        if self._closed:
+            return False
+        try:
+            self.search_index = future.result()
+        except Exception as e:
+            logger.error(f"Ошибка построения индекса поиска: {e}")
+            self.search_index = SearchIndex.build(self.apps)
+            self._search_pending = []
+        
+        for changed, removed in self._search_pending:
+            self._update_search_index(changed, removed)
+        self._search_pending = []
+        
+        # Запрос, введённый до готовности индекса, применяется сейчас
+        if self._search_text and self._search_timeout is None:
+            self._apply_search()
+        return False
+    
+    def _update_search_ranks(self):
+        """Ранжирование: сначала совпадения по началу слова, затем по frecency"""
+        if not self._search_text or self.search_index is None:
+            self._search_ranks = {}
+            return
+        self._search_ranks = {
+            name: (level, -self.filtered_apps[name].frecency, -similarity, name.lower())
+            for name, (level, similarity) in self.search_index.search(self._search_text).items()
+            if name in self.filtered_apps
+        }
+    
+    def _compare_search_rank(self, model, iter_a, iter_b, data) -> int:
+        """Сравнение строк по рангу результата поиска"""
+        rank_a = self._search_ranks.get(model.get_value(iter_a, 0))
+        rank_b = self._search_ranks.get(model.get_value(iter_b, 0))
+        if rank_a is None or rank_b is None:
+            return (rank_a is None) - (rank_b is None)
+        return (rank_a > rank_b) - (rank_a < rank_b)
+    
+    def _on_search_activate(self, entry):
+        """Enter в поле поиска открывает лучшее совпадение"""
+        if self._search_timeout is not None:
+            GLib.source_remove(self._search_timeout)
+            self._apply_search()
+        
+        treeiter = self.sort_model.get_iter_first()
+        if treeiter is None:
+            return
+        self.tree_view.get_selection().select_iter(treeiter)
+        self.dialog.response(Gtk.ResponseType.OK)
     
     def _on_reset_associations(self, button):
         """Обработчик сброса ассоциаций"""
@@ -916,7 +3542,6 @@ class AppChooserDialog:
         
         if response == Gtk.ResponseType.YES:
             self.config_manager.clear_all_associations()
-            self.config_manager.save_config()
             
             # Показываем уведомление
             info_dialog = Gtk.MessageDialog(
@@ -960,25 +3585,28 @@ class AppChooserDialog:
                 app_name = Path(file_path).stem.title()
                 custom_app = DesktopApp(
                     name=app_name,
-                    exec_cmd=file_path,
+                    exec_cmd=ExecTemplate.quote(file_path),
                     app_type='custom'
                 )
                 
                 # Добавляем в список
                 self.apps[app_name] = custom_app
+                if self.mime_index is not None:
+                    self.mime_index.add(app_name, custom_app.mime_types)
                 self.filtered_apps[app_name] = custom_app
+                self._candidates.add(app_name)
+                self._update_search_index([custom_app], [])
                 
                 # Сохраняем в конфигурацию
-                self.config_manager.config['custom_apps'].append({
+                self.config_manager.add_custom_app({
                     'name': app_name,
                     'exec_cmd': file_path,
                     'mime_types': [],
                     'original_path': file_path
                 })
-                self.config_manager.save_config()
                 
-                # Обновляем список
-                self._update_app_list()
+                # Добавляем строку в список
+                self._update_row(app_name)
         
         dialog.destroy()
     
@@ -997,7 +3625,7 @@ class AppChooserDialog:
         }
         
         # Сортировка
-        sort_column_id, sort_order = self.list_store.get_sort_column_id()
+        sort_column_id, sort_order = self._user_sort or self.sort_model.get_sort_column_id()
         sort_column_map = {0: 'name', 1: 'type', 2: 'priority', 3: 'usage'}
         sort_column = sort_column_map.get(sort_column_id, 'priority')
         sort_order_str = 'desc' if sort_order == Gtk.SortType.DESCENDING else 'asc'
@@ -1089,109 +3717,468 @@ class AppChooserDialog:
 
 class OpenWithChooser:
     def __init__(self):
-        self.discovery = AppDiscovery()
         self.config_manager = ConfigManager()
+        self.discovery = AppDiscovery()
+        self._apps = None  # реестр текущего запуска, общий для всех групп целей
+        self.mime_detector = MimeDetector()
+        self.apply_config()
         
-    def get_mime_type(self, target: str) -> str:
+    def apply_config(self):
+        """Применение настроек конфигурации (при запуске и после её перечитывания демоном)"""
+        config = self.config_manager.config
+        self.discovery.timeout = config.get('discovery_timeout', DISCOVERY_TIMEOUT)
+        self.context_detector = ContextDetector(config.get('context_rules'))
+        self.relevance = RelevanceRules(config.get('relevance_rules'))
+        _set_log_level(config.get('log_level'))
+        self.config_generation = self.config_manager.generation
+    
+    def get_mime_type(self, target: str, cwd: Optional[str] = None) -> str:
         """Получение MIME типа для цели"""
-        if target.startswith(('http://', 'https://')):
-            return 'text/html'
-        elif target.startswith('file://'):
-            target = target[7:]  # Удаляем префикс file://
-        
-        # Пытаемся получить MIME тип
-        if HAS_XDG:
-            try:
-                mime_obj = Mime.get_type(target)
-                return str(mime_obj) if mime_obj else 'application/octet-stream'
-            except:
-                pass
-        
-        # Fallback на основе расширения
-        ext = Path(target).suffix.lower()
-        mime_map = {
-            '.txt': 'text/plain',
-            '.html': 'text/html', '.htm': 'text/html',
-            '.pdf': 'application/pdf',
-            '.png': 'image/png', '.jpg': 'image/jpeg', '.jpeg': 'image/jpeg',
-            '.gif': 'image/gif', '.bmp': 'image/bmp',
-            '.mp4': 'video/mp4', '.avi': 'video/x-msvideo',
-            '.mp3': 'audio/mpeg', '.wav': 'audio/wav',
-            '.zip': 'application/zip', '.tar': 'application/x-tar',
-            '.gz': 'application/gzip',
-            '.deb': 'application/vnd.debian.binary-package',
-            '.AppImage': 'application/x-executable'
-        }
-        
-        return mime_map.get(ext, 'application/octet-stream')
+        return self.mime_detector.detect([target], cwd)[target]
     
-    def run_app(self, app: DesktopApp, targets: List[str]) -> bool:
+    def run_app(self, app: DesktopApp, targets: List[str],
+                environ: Optional[Dict[str, str]] = None, cwd: Optional[str] = None,
+                context: Optional[str] = None, mime_type: Optional[str] = None) -> bool:
         """Запуск приложения с целями"""
         # Проверяем доступность приложения
-        if not app.is_available:
+        if not app.check_availability():
             logger.warning(f"Приложение {app.name} недоступно, запуск пропущен")
             return False
             
         try:
-            cmd = app.format_exec(targets)
-            logger.info(f"Запуск: {' '.join(cmd)}")
+            commands = app.build_commands(targets, environ)
             
-            # Увеличиваем счетчик использования
-            self.config_manager.increment_usage(app.name)
-            self.config_manager.save_config()
+            # Приложения с %f/%u получают процесс на каждый файл; ограничивается скорость
+            # запуска: сразу стартуют LAUNCH_CONCURRENCY процессов, остальные — из очереди
+            running = []
+            for cmd in commands[:LAUNCH_CONCURRENCY]:
+                process = self._spawn(cmd, environ, cwd)
+                if process is not None:
+                    running.append(process)
+            launched = bool(running)
+            pending = commands[LAUNCH_CONCURRENCY:]
+            if launched and pending:
+                # Поток не фоновый: процесс селектора дожидается запуска всей очереди,
+                # но не завершения запущенных приложений
+                threading.Thread(target=self._spawn_queued, args=(running, pending, environ, cwd),
+                                 name='launch-queue').start()
             
-            subprocess.Popen(cmd, start_new_session=True)
-            return True
+            if launched:
+                # Увеличиваем счетчик использования
+                self.config_manager.increment_usage(app, context, mime_type)
+            return launched
         except Exception as e:
             logger.error(f"Ошибка запуска {app.name}: {e}")
             return False
     
-    def choose_and_run(self, targets: List[str]):
-        """Основной метод: выбор и запуск приложения"""
+    def _spawn_queued(self, running: List[subprocess.Popen], pending: List[List[str]],
+                      environ: Optional[Dict[str, str]], cwd: Optional[str]):
+        """Запуск оставшихся команд по мере завершения запущенных процессов
+
+        Быстро завершающиеся процессы (передающие файл уже открытому окну) освобождают
+        место сразу; долго работающие окна ждутся не дольше LAUNCH_STAGGER, после чего
+        стартует следующая партия.
+        """
+        for cmd in pending:
+            deadline = time.monotonic() + LAUNCH_STAGGER
+            while True:
+                running = [process for process in running if process.poll() is None]
+                if len(running) < LAUNCH_CONCURRENCY:
+                    break
+                if time.monotonic() >= deadline:
+                    # Оставшиеся процессы — открытые окна: больше их не учитываем
+                    running = []
+                    break
+                time.sleep(LAUNCH_POLL_INTERVAL)
+            process = self._spawn(cmd, environ, cwd)
+            if process is not None:
+                running.append(process)
+    
+    def _spawn(self, cmd: List[str], environ: Optional[Dict[str, str]],
+               cwd: Optional[str]) -> Optional[subprocess.Popen]:
+        """Запуск одного процесса приложения"""
+        try:
+            logger.info(f"Запуск: {cmd[0]} ({len(cmd) - 1} аргументов)")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Командная строка: {' '.join(cmd)}")
+            with _span('spawn', command=cmd[0]):
+                return subprocess.Popen(cmd, start_new_session=True, env=environ, cwd=cwd)
+        except Exception as e:
+            logger.error(f"Ошибка запуска {cmd[0] if cmd else ''}: {e}")
+            return None
+    
+    def choose_and_run(self, targets: List[str], environ: Optional[Dict[str, str]] = None,
+                       cwd: Optional[str] = None, ppid: Optional[int] = None):
+        """Основной метод: выбор и запуск приложения
+
+        environ, cwd и ppid (родитель) описывают вызывающий процесс, если он
+        отличается от текущего (запрос клиента резидентного режима).
+        """
         if not targets:
             return
         
-        # Определяем контекст и MIME тип
-        context = ContextDetector.get_invoker_context()
-        mime_type = self.get_mime_type(targets[0])
+        # Цели группируются по MIME типу: у каждой группы своё приложение
+        context, groups = self._group_targets(targets, environ, cwd, ppid)
         
-        logger.info(f"Контекст: {context}, MIME: {mime_type}, Цели: {targets}")
+        self._apps = None
+        try:
+            for mime_type, group in groups.items():
+                self._choose_and_run(group, context, mime_type, environ, cwd)
+        finally:
+            # Все изменения конфигурации за запуск записываются одной атомарной операцией
+            self.config_manager.save_config()
+    
+    def _choose_and_run(self, targets: List[str], context: str, mime_type: str,
+                        environ: Optional[Dict[str, str]], cwd: Optional[str]):
+        """Выбор приложения для группы целей одного MIME типа: быстрый путь, запомненный выбор или диалог"""
+        logger.info(f"Контекст: {context}, MIME: {mime_type}, целей: {len(targets)}")
         
-        # Проверяем запомненный выбор
-        remembered_app = self.config_manager.get_context_choice(context, mime_type)
-        apps = self.discovery.discover_all()
+        # Быстрый путь: запомненный выбор проверяется и запускается без полного обнаружения
+        remembered = self.config_manager.get_context_choice_entry(context, mime_type)
+        if remembered:
+            with _span('resolve_remembered'):
+                app = self.discovery.resolve_entry(remembered)
+            if app and self.run_app(app, targets, environ, cwd, context, mime_type):
+                return
+        
+        # Диалог открывается по кэшированному набору, остальное дополняется в фоне.
+        # Реестр загружается один раз на все группы целей.
+        if self._apps is None:
+            self._apps = self.discovery.discover_cached()
+        apps = self._apps
+        if remembered and remembered.get('name') not in apps:
+            # Запомненное приложение ещё не попадало в кэш реестра
+            apps = self._apps = self.discovery.discover_all()
         
-        if remembered_app and remembered_app in apps:
-            if self.run_app(apps[remembered_app], targets):
+        if remembered:
+            remembered_app = apps.get(remembered.get('name'))
+            if remembered_app and self.run_app(remembered_app, targets, environ, cwd, context, mime_type):
+                # Обновляем устаревшую запись, чтобы следующий запуск прошёл по быстрому пути
+                self.config_manager.set_context_choice(context, mime_type, remembered_app)
                 return
             else:
                 # Удаляем плохой запомненный выбор
                 self.config_manager.clear_context_choice(context, mime_type)
-                self.config_manager.save_config()
         
         # Показываем диалог выбора
         try:
-            dialog = AppChooserDialog(apps, targets, context, mime_type, self.config_manager)
+            # Реестр могут менять фоновые источники предыдущей группы целей
+            apps = self.discovery.snapshot()
+            # Индекс поиска готовится в фоне, пока импортируется GTK и строится окно
+            search_index = self.discovery.search_index_async(apps)
+            _import_gtk()
+            with _span('dialog.init', apps=len(apps)):
+                dialog = AppChooserDialog(apps, targets, context, mime_type, self.config_manager,
+                                          self.discovery.mime_index, self.relevance, search_index)
+            self.discovery.discover_async(dialog.update_apps)
             selected_app, remember = dialog.show()
             
             if selected_app:
                 if remember:
-                    self.config_manager.set_context_choice(context, mime_type, selected_app.name)
-                    self.config_manager.save_config()
+                    self.config_manager.set_context_choice(context, mime_type, selected_app)
 
-                self.run_app(selected_app, targets)
+                self.run_app(selected_app, targets, environ, cwd, context, mime_type)
         except Exception as e:
             logger.error(f"Ошибка диалога: {e}")
+    
+    def _group_targets(self, targets: List[str], environ: Optional[Dict[str, str]],
+                       cwd: Optional[str], ppid: Optional[int]) -> Tuple[str, Dict[str, List[str]]]:
+        """Контекст вызова и цели, сгруппированные по MIME типу"""
+        context = self.context_detector.get_invoker_context(environ, ppid)
+        mime_types = self.mime_detector.detect(targets, cwd)
+        groups = {}
+        for target in targets:
+            groups.setdefault(mime_types[target], []).append(target)
+        return context, groups
+    
+    def resolve(self, targets: List[str], environ: Optional[Dict[str, str]] = None,
+                cwd: Optional[str] = None, ppid: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Запомненный выбор и ранжированные кандидаты для каждой группы целей (без GTK)"""
+        context, groups = self._group_targets(targets, environ, cwd, ppid)
+        apps = self.discovery.discover_all()
+        
+        results = []
+        for mime_type, group in groups.items():
+            # Ранжирование то же, что в диалоге; окно не создаётся
+            ranking = AppChooserDialog(dict(apps), group, context, mime_type, self.config_manager,
+                                       self.discovery.mime_index, self.relevance)
+            results.append({
+                'targets': group,
+                'context': context,
+                'mime_type': mime_type,
+                'remembered': self.config_manager.get_context_choice_entry(context, mime_type),
+                'candidates': [self.describe_app(app, ranking.priorities.get(name))
+                               for name, app in ranking.filtered_apps.items()]
+            })
+        return results
+    
+    def launch_remembered(self, targets: List[str], environ: Optional[Dict[str, str]] = None,
+                          cwd: Optional[str] = None, ppid: Optional[int] = None) -> int:
+        """Запуск только по запомненному выбору; без выбора для любой группы ничего не запускается
+
+        Возвращает код завершения: 0, EXIT_NO_CHOICE (нет запомненного выбора)
+        или 1 (выбор есть, но запуск не удался).
+        """
+        context, groups = self._group_targets(targets, environ, cwd, ppid)
+        
+        launches = []
+        unavailable = False
+        for mime_type, group in groups.items():
+            if not self.config_manager.get_context_choice_entry(context, mime_type):
+                logger.error(f"Нет запомненного выбора для {context}:{mime_type}")
+                return EXIT_NO_CHOICE
+            app = self._remembered_app(context, mime_type)
+            if app is None:
+                logger.error(f"Запомненное приложение для {context}:{mime_type} недоступно")
+                unavailable = True
+            launches.append((app, group, mime_type))
+        if unavailable:
+            return 1
+        
+        try:
+            launched = [self.run_app(app, group, environ, cwd, context, mime_type)
+                        for app, group, mime_type in launches]
+            return 0 if all(launched) else 1
+        finally:
+            self.config_manager.save_config()
+    
+    def _remembered_app(self, context: str, mime_type: str) -> Optional[DesktopApp]:
+        """Доступное запомненное приложение; записи старого формата ищутся среди обнаруженных"""
+        remembered = self.config_manager.get_context_choice_entry(context, mime_type)
+        if not remembered:
+            return None
+        app = self.discovery.resolve_entry(remembered)
+        if app is None and not (remembered.get('desktop_file') or remembered.get('exec_cmd')):
+            if self._apps is None:
+                self._apps = self.discovery.discover_all()
+            app = self._apps.get(remembered.get('name'))
+            if app and not app.check_availability():
+                app = None
+        return app
+    
+    @staticmethod
+    def describe_app(app: DesktopApp, priority: Optional[int] = None) -> Dict[str, Any]:
+        """Описание приложения для --list и --resolve (priority — приоритет для цели)"""
+        info = app.to_choice_entry()
+        info.update({
+            'generic_name': app.generic_name,
+            'mime_types': app.mime_types,
+            'categories': app.categories,
+            'priority': app.priority if priority is None else priority,
+            'frecency': round(app.frecency, 3),
+            'usage_count': app.usage_count,
+            'available': app.is_available
+        })
+        return info
+
+class ChooserDaemon:
+    """Резидентный режим: реестр, конфигурация и главный цикл GTK остаются в памяти"""
+    
+    def __init__(self, socket_path: Path = SOCKET_PATH):
+        self.socket_path = socket_path
+        self.chooser = OpenWithChooser()
+        self.server = None
+    
+    def run(self) -> int:
+        """Запуск демона и главного цикла GTK"""
+        if self._is_running():
+            logger.error(f"Демон уже запущен: {self.socket_path}")
+            return 1
+        
+        import socket
+        _import_gtk()
+        
+        self.socket_path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            self.socket_path.unlink()
+        except FileNotFoundError:
+            pass
+        
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(str(self.socket_path))
+        os.chmod(self.socket_path, stat.S_IRUSR | stat.S_IWUSR)
+        self.server.listen(16)
+        
+        # Прогреваем реестр и индекс поиска до первого запроса
+        discovery = self.chooser.discovery
+        discovery.search_index_async(discovery.discover_all())
+        
+        GLib.io_add_watch(self.server.fileno(), GLib.PRIORITY_DEFAULT, GLib.IO_IN, self._on_connection)
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            GLib.unix_signal_add(GLib.PRIORITY_DEFAULT, signum, Gtk.main_quit)
+        
+        logger.info(f"Демон запущен: {self.socket_path}")
+        try:
+            Gtk.main()
+        finally:
+            self.server.close()
+            try:
+                self.socket_path.unlink()
+            except FileNotFoundError:
+                pass
+        return 0
+    
+    def _is_running(self) -> bool:
+        """Проверка, отвечает ли уже другой демон на сокете"""
+        import socket
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+                probe.connect(str(self.socket_path))
+            return True
+        except OSError:
+            return False
+    
+    def _on_connection(self, fd, condition) -> bool:
+        """Приём запроса клиента"""
+        import socket
+        import struct
+        try:
+            conn, _ = self.server.accept()
+        except OSError as e:
+            logger.debug(f"Ошибка приёма соединения: {e}")
+            return True
+        
+        with conn:
+            try:
+                conn.settimeout(2)
+                pid, uid, _ = struct.unpack('3i', conn.getsockopt(
+                    socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i')))
+                if uid != os.getuid():
+                    logger.warning(f"Отклонён запрос от чужого пользователя (uid {uid})")
+                    return True
+                
+                data = b''
+                while True:
+                    chunk = conn.recv(65536)
+                    if not chunk:
+                        break
+                    data += chunk
+                request = json.loads(data.decode('utf-8'))
+                # Контекст определяется по родителю клиента. Клиент завершается сразу
+                # после ответа, поэтому родитель берётся из запроса или из /proc до ответа
+                ppid = request.get('ppid')
+                if not isinstance(ppid, int) or ppid <= 0:
+                    info = ContextDetector._read_stat(pid)
+                    ppid = info[1] if info else 0
+                conn.sendall(b'ok\n')
+            except Exception as e:
+                logger.error(f"Некорректный запрос клиента: {e}")
+                return True
+        
+        # Обрабатываем вне обработчика сокета: диалог запускает вложенный цикл
+        GLib.idle_add(self._handle_request, request, ppid)
+        return True
+    
+    def _handle_request(self, request: Dict[str, Any], ppid: int) -> bool:
+        """Обработка запроса клиента"""
+        cwd = request.get('cwd') or None
+        environ = request.get('env') or None
+        targets = [
+            target if '://' in target or os.path.isabs(target) or not cwd
+            else os.path.join(cwd, target)
+            for target in request.get('argv', [])
+        ]
+        
+        try:
+            # Файл мог перечитаться и при записи (save_config) после прошлого запроса
+            self.chooser.config_manager.reload_if_changed()
+            if self.chooser.config_manager.generation != self.chooser.config_generation:
+                self.chooser.apply_config()
+            self.chooser.choose_and_run(targets, environ=environ, cwd=cwd, ppid=ppid)
+        except Exception as e:
+            logger.error(f"Ошибка обработки запроса: {e}")
+        return False
+
+def _run_headless(args) -> int:
+    """Режимы без GTK для скриптов и интеграций: --list, --resolve, --launch-remembered"""
+    if not args.list and not args.targets:
+        print("Укажите URL или файлы", file=sys.stderr)
+        return 1
+    
+    try:
+        chooser = OpenWithChooser()
+        chooser.discovery.rescan = args.rescan
+        
+        if args.launch_remembered:
+            return chooser.launch_remembered(args.targets)
+        
+        if args.list:
+            apps = chooser.discovery.discover_all()
+            result = [OpenWithChooser.describe_app(app)
+                      for app in sorted(apps.values(), key=lambda app: app.name.lower())]
+            if args.json:
+                print(json.dumps(result, ensure_ascii=False, indent=2))
+            else:
+                for info in result:
+                    status = '✓' if info['available'] else '✗'
+                    print(f"{status} {info['name']}\t{info['app_type']}\t{info['desktop_file'] or info['exec_cmd']}")
+            return 0
+        
+        groups = chooser.resolve(args.targets)
+        if args.json:
+            print(json.dumps(groups, ensure_ascii=False, indent=2))
+        else:
+            for group in groups:
+                remembered = (group['remembered'] or {}).get('name')
+                print(f"{group['context']}:{group['mime_type']}  {' '.join(group['targets'])}")
+                for position, info in enumerate(group['candidates'], 1):
+                    mark = '*' if info['name'] == remembered else ' '
+                    print(f"{mark} {position:3}. {info['name']}  ({info['app_type']}, frecency {info['frecency']})")
+        return 0
+    except Exception as e:
+        logger.error(f"Критическая ошибка: {e}")
+        return 1
 
 def main():
-    if len(sys.argv) < 2:
+    parser = argparse.ArgumentParser(
+        prog='open-with-chooser',
+        description='Универсальный селектор приложений для URL и файлов'
+    )
+    parser.add_argument('--daemon', action='store_true',
+                        help='запустить резидентный режим для open-with-chooser-client')
+    parser.add_argument('--rescan', action='store_true',
+                        help='игнорировать кэш реестра и заново найти приложения (включая Tor Browser)')
+    parser.add_argument('--profile', nargs='?', const='1', metavar='FILE',
+                        default=os.environ.get(PROFILE_ENV),
+                        help=f'записать трассировку этапов в формате Chrome Trace (также {PROFILE_ENV})')
+    modes = parser.add_mutually_exclusive_group()
+    modes.add_argument('--list', action='store_true',
+                       help='вывести найденные приложения без интерфейса')
+    modes.add_argument('--resolve', action='store_true',
+                       help='вывести запомненный выбор и ранжированных кандидатов для целей без интерфейса')
+    modes.add_argument('--launch-remembered', action='store_true',
+                       help=f'запустить только запомненный выбор; без него завершиться с кодом {EXIT_NO_CHOICE}, '
+                            'при ошибке запуска — с кодом 1')
+    parser.add_argument('--json', action='store_true', help='вывод --list и --resolve в формате JSON')
+    parser.add_argument('targets', nargs='*', help='URL или файлы')
+    args = parser.parse_args()
+    
+    _setup_environment()
+    if args.profile:
+        _enable_profiling(args.profile)
+    
+    if args.daemon:
+        sys.exit(ChooserDaemon().run())
+    
+    if args.list or args.resolve or args.launch_remembered:
+        sys.exit(_run_headless(args))
+    
+    if args.rescan and not args.targets:
+        # Только обновление кэша реестра
+        discovery = AppDiscovery()
+        discovery.rescan = True
+        discovery.discover_all()
+        return
+    
+    if not args.targets:
         print("Использование: open-with-chooser <url|файл> [файл2] ...")
         sys.exit(1)
     
-    targets = sys.argv[1:]
+    targets = args.targets
     
     try:
         chooser = OpenWithChooser()
+        chooser.discovery.rescan = args.rescan
         chooser.choose_and_run(targets)
     except Exception as e:
         logger.error(f"Критическая ошибка: {e}")